@@ -0,0 +1,171 @@
+import re
+import lxml.html
+from lxml.etree import ParserError
+
+# Wikipedia sections that are not part of the article itself
+UNWANTED_SECTIONS = {
+    'navigation menu', 'references', 'external links', 'contents',
+    'see also', 'notes', 'citations', 'bibliography',
+}
+
+# Elements that never hold article text
+SKIP_TAGS = {'script', 'style', 'noscript', 'iframe', 'nav', 'header', 'footer', 'aside', 'form', 'svg', 'template'}
+
+# Class names of boilerplate containers (ads, comments, menus, share bars...)
+BOILERPLATE_CLASS = re.compile(
+    r"header|footer|\bnav|aside|advert|comments|sidebar|menu|social-links|related-posts|(?:^|[\s_-])ads?(?:$|[\s_-])",
+    re.IGNORECASE
+)
+
+# Wikipedia markup inside paragraphs: footnote markers and [edit] links
+WIKIPEDIA_NOISE = (
+    ".//sup[contains(concat(' ', normalize-space(@class), ' '), ' reference ')]"
+    " | .//a[contains(concat(' ', normalize-space(@class), ' '), ' reference ')]"
+    " | .//span[contains(concat(' ', normalize-space(@class), ' '), ' mw-editsection ')]"
+    " | .//style | .//script"
+)
+
+# Leftover reference markers such as [1], [2, 3] or [citation needed]
+REFERENCE_PATTERN = re.compile(r"\[(?:\d[\d\s,]*|citation needed)\]")
+
+HEADING_LEVELS = {'h1': 1, 'h2': 2, 'h3': 3}
+LIST_TAGS = {'ul', 'ol'}
+
+# Shorter paragraphs are usually captions, bylines or buttons
+MIN_PARAGRAPH_CHARS = 20
+
+def clean_text(text):
+    """Strip reference markers and collapse whitespace"""
+    return " ".join(REFERENCE_PATTERN.sub("", text).split())
+
+def is_boilerplate(element):
+    if element.tag in SKIP_TAGS:
+        return True
+    class_name = element.get('class')
+    return bool(class_name and BOILERPLATE_CLASS.search(class_name))
+
+def find_title(tree, is_wikipedia):
+    """Return the article title from the Wikipedia heading, social meta tags, a headline h1 or <title>"""
+    if is_wikipedia:
+        heading = tree.find(".//*[@id='firstHeading']")
+        if heading is not None:
+            return clean_text(heading.text_content())
+
+    for xpath in (
+        "//meta[@property='og:title']/@content",
+        "//meta[@name='twitter:title']/@content",
+        "//h1[contains(@class, 'title') or contains(@class, 'headline')]",
+        "//title",
+    ):
+        for candidate in tree.xpath(xpath):
+            title = clean_text(candidate if isinstance(candidate, str) else candidate.text_content())
+            if title:
+                return title
+    return None
+
+def find_main_content(tree):
+    """Return the element most likely to hold the article, skipping candidates inside boilerplate"""
+    for xpath in (
+        "//article",
+        "//main",
+        "//*[contains(translate(@class, 'CONTENT', 'content'), 'content')]",
+        "//*[contains(translate(@id, 'CONTENT', 'content'), 'content')]",
+        "//div[contains(translate(@class, 'POSTARTICLE', 'postarticle'), 'post')"
+        " or contains(translate(@class, 'POSTARTICLE', 'postarticle'), 'article')]",
+    ):
+        for candidate in tree.xpath(xpath):
+            if not is_boilerplate(candidate) and not any(is_boilerplate(ancestor) for ancestor in candidate.iterancestors()):
+                return candidate
+    return tree.find('body')
+
+def own_text(element):
+    """Text of an element without its nested lists (those are emitted as their own items)"""
+    parts = [element.text or ""]
+    for child in element:
+        if child.tag not in LIST_TAGS and isinstance(child.tag, str) and not is_boilerplate(child):
+            parts.append(child.text_content())
+        parts.append(child.tail or "")
+    return clean_text("".join(parts))
+
+def iter_blocks(container, title=None, unwanted_sections=()):
+    """
+    Walk container once in document order and yield its text blocks as (kind, text).
+    kind is "heading", "paragraph" or "item". Boilerplate subtrees are pruned as they are reached,
+    and everything below a heading in unwanted_sections is skipped until the next heading of that level.
+    """
+    skip_level = None
+    stack = [container]
+    while stack:
+        element = stack.pop()
+        if not isinstance(element.tag, str) or (element is not container and is_boilerplate(element)):
+            continue  # Comments, processing instructions and boilerplate
+
+        tag = element.tag
+        if tag in HEADING_LEVELS:
+            level = HEADING_LEVELS[tag]
+            text = clean_text(element.text_content())
+            if skip_level is not None and level <= skip_level:
+                skip_level = None
+            if text.lower() in unwanted_sections:
+                skip_level = level
+            elif skip_level is None and text and text != title:
+                yield "heading", text
+            continue
+
+        if skip_level is not None and tag in ('p', 'li'):
+            continue
+
+        if tag == 'p':
+            text = clean_text(element.text_content())
+            if len(text) > MIN_PARAGRAPH_CHARS:
+                yield "paragraph", text
+            continue
+
+        if tag == 'li':
+            text = own_text(element)
+            if text:
+                yield "item", text
+
+        # Children are visited in document order
+        stack.extend(reversed(element))
+
+def extract_article(html, url=""):
+    """
+    Extract the readable text of an article page.
+    Args:
+        html (bytes or str): The page source.
+        url (str): The page URL, Wikipedia pages get dedicated handling.
+    Returns:
+        text (str): The title and underlined headings, paragraphs and "•" list items, one per line.
+    """
+    try:
+        tree = lxml.html.document_fromstring(html)
+    except ParserError:
+        return ""  # Empty document
+
+    is_wikipedia = 'wikipedia.org' in url
+    title = find_title(tree, is_wikipedia)
+
+    container = tree.find(".//*[@id='mw-content-text']") if is_wikipedia else None
+    if container is not None:
+        for element in container.xpath(WIKIPEDIA_NOISE):
+            element.drop_tree()  # Keeps the text that follows the element
+        unwanted_sections = UNWANTED_SECTIONS
+    else:
+        container = find_main_content(tree)
+        unwanted_sections = ()
+
+    lines = []
+    if title:
+        lines += [title.upper(), '=' * len(title)]
+
+    if container is not None:
+        for kind, text in iter_blocks(container, title, unwanted_sections):
+            if kind == "heading":
+                lines += [text.upper(), '=' * len(text)]
+            elif kind == "item":
+                lines.append(f"• {text}")
+            else:
+                lines.append(text)
+
+    return "\n".join(lines)
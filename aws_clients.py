@@ -0,0 +1,82 @@
+import os
+import threading
+import boto3
+from botocore.config import Config
+
+# Connections kept open per client, size it to the app's concurrency
+# (JOB_MAX_CONCURRENT x POLLY_MAX_IN_FLIGHT, plus headroom for image and script calls)
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "50"))
+
+# (connect_timeout, read_timeout) in seconds per service
+SERVICE_TIMEOUTS = {
+    "bedrock-runtime": (10, 300),  # Long scripts and image generation can take minutes
+    "polly": (5, 60),
+}
+DEFAULT_TIMEOUTS = (10, 60)
+
+_clients = {}
+_clients_lock = threading.Lock()
+_session = None
+
+def client_config(service_name):
+    """Return the botocore Config used for a service"""
+    connect_timeout, read_timeout = SERVICE_TIMEOUTS.get(service_name, DEFAULT_TIMEOUTS)
+    return Config(
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+        # No botocore retries, rate_limit.call_with_limits owns the single retry policy
+        retries={"mode": "standard", "total_max_attempts": 1},
+    )
+
+def get_client(service_name, region_name=None):
+    """
+    Return the shared client for a service and region.
+
+    Clients are created once per process and reused by every session and thread (boto3 clients are
+    thread-safe once created), so credentials are resolved and TLS connections are opened only once.
+    """
+    global _session
+    key = (service_name, region_name)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    # Creating clients from a session is not thread-safe, so it is serialized
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            if _session is None:
+                _session = boto3.session.Session()
+            client = _session.client(service_name, region_name=region_name, config=client_config(service_name))
+            _clients[key] = client
+        return client
+
+def connection_stats():
+    """
+    Return connection reuse statistics per client, read from the underlying urllib3 pools.
+    Returns:
+        stats (dict): {"service@region": {"requests": n, "connections": n, "reuse_ratio": r}}
+    """
+    stats = {}
+    with _clients_lock:
+        clients = dict(_clients)
+
+    for (service_name, region_name), client in clients.items():
+        requests = 0
+        connections = 0
+        try:
+            pools = client._endpoint.http_session._manager.pools
+            for pool_key in list(pools.keys()):
+                pool = pools[pool_key]
+                requests += pool.num_requests
+                connections += pool.num_connections
+        except (AttributeError, KeyError):
+            continue  # botocore/urllib3 internals changed, skip this client
+
+        stats[f"{service_name}@{region_name or client.meta.region_name}"] = {
+            "requests": requests,
+            "connections": connections,
+            "reuse_ratio": 1 - connections / requests if requests else 0.0,
+        }
+    return stats
@@ -0,0 +1,216 @@
+"""
+Generate DocTalk episodes in bulk from a manifest, without the Streamlit UI.
+
+Usage:
+    python batch.py manifest.jsonl --output episodes/ [--concurrency 4]
+
+Each manifest row (a JSON object per line, or a CSV row with a header) describes one episode:
+    id       Optional unique name, used for the output directory and to resume.
+    source   "document", "url" or "script".
+    path     The document or script file (relative paths are resolved from the manifest's directory).
+    url      The article URL, for source "url".
+    prompt   Optional additional prompt.
+    media    "audio" (default) or "video".
+    force    true to regenerate the episode even if it is in the episode cache.
+
+Finished items are appended to <output>/report.jsonl as they complete. Running the same command
+again skips the items that already succeeded, so an interrupted batch picks up where it stopped.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import shutil
+import time
+from episode import run_episode
+from jobs import JobRunner
+
+SOURCES = {"document": "Document", "url": "URL", "script": "Existing Script"}
+MEDIA = {"audio": "Audio", "video": "Video"}
+
+# Define ManifestError exception
+class ManifestError(Exception):
+    """Custom exception for invalid manifest rows."""
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+def read_manifest(manifest_path):
+    """Return the manifest rows as dicts, from a JSONL or CSV file"""
+    with open(manifest_path, encoding="utf-8", newline="") as manifest_file:
+        if manifest_path.lower().endswith(".csv"):
+            return [{key: value for key, value in row.items() if value} for row in csv.DictReader(manifest_file)]
+        return [json.loads(line) for line in manifest_file if line.strip()]
+
+def item_id(row, index):
+    """A filesystem-safe id for a row, from its id, file name or URL"""
+    name = row.get("id") or os.path.splitext(os.path.basename(row.get("path", "")))[0] or row.get("url", "") or f"item_{index}"
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("_")[:80] or f"item_{index}"
+
+def prepare_items(rows, base_dir):
+    """Validate the rows and give every item a unique id"""
+    items = []
+    seen = set()
+    for index, row in enumerate(rows, start=1):
+        source = str(row.get("source", "document" if row.get("path") else "url")).lower()
+        if source not in SOURCES:
+            raise ManifestError(f"Row {index}: unknown source {source!r}, expected one of {sorted(SOURCES)}")
+        if source == "url" and not row.get("url"):
+            raise ManifestError(f"Row {index}: source url needs a url")
+        if source != "url" and not row.get("path"):
+            raise ManifestError(f"Row {index}: source {source} needs a path")
+
+        media = str(row.get("media", "audio")).lower()
+        if media not in MEDIA:
+            raise ManifestError(f"Row {index}: unknown media {media!r}, expected audio or video")
+
+        episode_id = item_id(row, index)
+        if episode_id in seen:
+            episode_id = f"{episode_id}_{index}"
+        seen.add(episode_id)
+
+        path = row.get("path")
+        items.append({
+            "id": episode_id,
+            "source": source,
+            "path": os.path.join(base_dir, path) if path else None,
+            "url": row.get("url"),
+            "prompt": row.get("prompt"),
+            "media": media,
+            "force": str(row.get("force", "")).lower() in ("1", "true", "yes"),
+        })
+    return items
+
+def read_report(report_path):
+    """Return the last report entry of every item id"""
+    entries = {}
+    if os.path.exists(report_path):
+        with open(report_path, encoding="utf-8") as report_file:
+            for line in report_file:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry["id"]] = entry
+    return entries
+
+def episode_kwargs(item, force_regenerate=False):
+    """The run_episode arguments for a manifest item"""
+    kwargs = {
+        "source": SOURCES[item["source"]],
+        "url": item["url"],
+        "user_prompt": item["prompt"],
+        "media_option": MEDIA[item["media"]],
+        "force_regenerate": force_regenerate or item["force"],
+        "progressive": False,  # Nobody is listening
+    }
+    if item["path"]:
+        with open(item["path"], "rb") as document_file:
+            kwargs["document_bytes"] = document_file.read()
+        kwargs["document_name"] = os.path.basename(item["path"])
+    return kwargs
+
+def collect_outputs(snapshot, item_dir):
+    """Copy the episode files out of the job workspace and return their paths"""
+    os.makedirs(item_dir, exist_ok=True)
+    artifacts = snapshot["artifacts"]
+    outputs = {}
+    for name in ("audio", "video", "image"):
+        if artifacts.get(name) and os.path.exists(artifacts[name]):
+            extension = os.path.splitext(artifacts[name])[1]
+            outputs[name] = shutil.copyfile(artifacts[name], os.path.join(item_dir, f"{name}{extension}"))
+    if artifacts.get("script"):
+        outputs["script"] = os.path.join(item_dir, "script.txt")
+        with open(outputs["script"], "w", encoding="utf-8") as script_file:
+            script_file.write(artifacts["script"])
+    return outputs
+
+def run_batch(items, output_dir, concurrency, retry_failed=True, force_regenerate=False):
+    """
+    Run the items with at most concurrency episodes at once and append each result to the report.
+    Returns:
+        results (list): The report entries written by this run.
+
+    Documents are only read when their episode starts, so memory stays bounded by the concurrency
+    rather than by the manifest size. AWS calls share the process-wide clients and rate limiters.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    report_path = os.path.join(output_dir, "report.jsonl")
+    previous = read_report(report_path)
+    todo = [item for item in items if previous.get(item["id"], {}).get("status") != "succeeded"
+            and (retry_failed or item["id"] not in previous)]
+    print(f"{len(items)} items, {len(items) - len(todo)} already done, {len(todo)} to run")
+
+    runner = JobRunner(max_jobs=concurrency)
+    running = {}
+    results = []
+    try:
+        with open(report_path, "a", encoding="utf-8") as report_file:
+            while todo or running:
+                # Keep exactly concurrency episodes in flight
+                while todo and len(running) < concurrency:
+                    item = todo.pop(0)
+                    try:
+                        job = runner.submit(run_episode, **episode_kwargs(item, force_regenerate))
+                    except OSError as e:
+                        entry = {"id": item["id"], "status": "failed", "error": f"Unable to read {item['path']}: {e}"}
+                        report_file.write(json.dumps(entry) + "\n")
+                        report_file.flush()
+                        results.append(entry)
+                        continue
+                    running[job.job_id] = item
+
+                time.sleep(1)
+                for job_id, item in list(running.items()):
+                    job = runner.get(job_id)
+                    if not job.done():
+                        continue
+
+                    snapshot = job.snapshot()
+                    entry = {
+                        "id": item["id"],
+                        "status": snapshot["status"],
+                        "error": snapshot["error"],
+                        "title": snapshot["artifacts"].get("title"),
+                        "outputs": collect_outputs(snapshot, os.path.join(output_dir, item["id"])) if snapshot["status"] == "succeeded" else {},
+                        "seconds": round(snapshot["finished"] - snapshot["started"], 1) if snapshot["started"] else 0.0,
+                        "stage_timings": {stage: round(seconds, 1) for stage, seconds in snapshot["stage_timings"].items()},
+                        "finished": snapshot["finished"],
+                    }
+                    report_file.write(json.dumps(entry) + "\n")
+                    report_file.flush()
+                    results.append(entry)
+                    runner.discard(job_id)
+                    del running[job_id]
+                    print(f"[{entry['status']}] {item['id']} in {entry['seconds']}s" + (f": {entry['error']}" if entry["error"] else ""))
+    except KeyboardInterrupt:
+        # Unfinished items are not in the report, the next run starts them again
+        print("Interrupted, cancelling running episodes...")
+        for job_id in running:
+            runner.cancel(job_id)
+        while not all(runner.get(job_id).done() for job_id in running):
+            time.sleep(0.5)
+        for job_id in running:
+            runner.discard(job_id)
+        raise
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="JSONL or CSV manifest")
+    parser.add_argument("--output", default="episodes", help="Directory for the episodes and report.jsonl")
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get("BATCH_CONCURRENCY", "4")), help="Episodes generated at once")
+    parser.add_argument("--force-regenerate", action="store_true", help="Ignore the episode cache")
+    parser.add_argument("--skip-failed", action="store_true", help="Don't retry items that failed in a previous run")
+    args = parser.parse_args()
+
+    items = prepare_items(read_manifest(args.manifest), os.path.dirname(os.path.abspath(args.manifest)))
+
+    started = time.time()
+    results = run_batch(items, args.output, args.concurrency, retry_failed=not args.skip_failed, force_regenerate=args.force_regenerate)
+
+    succeeded = sum(1 for entry in results if entry["status"] == "succeeded")
+    print(f"Done in {time.time() - started:.0f}s: {succeeded} succeeded, {len(results) - succeeded} failed or cancelled")
+    print(f"Report: {os.path.join(args.output, 'report.jsonl')}")
+
+if __name__ == "__main__":
+    main()
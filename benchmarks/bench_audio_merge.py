@@ -0,0 +1,77 @@
+"""
+Compare the stream copy and re-encode MP3 merge paths.
+
+Usage:
+    python benchmarks/bench_audio_merge.py [--counts 50 200 1000] [--segment-seconds 6]
+
+Segments are synthetic 24 kHz mono MP3s, the same shape as Polly's generative output.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from media import concat_mp3_reencode, concat_mp3_stream_copy, run_ffmpeg
+
+def make_segments(work_dir, count, segment_seconds):
+    """Create count MP3 segments by copying one synthetic tone"""
+    template = os.path.join(work_dir, "template.mp3")
+    run_ffmpeg([
+        "-f", "lavfi", "-i", f"sine=frequency=220:duration={segment_seconds}",
+        "-ar", "24000", "-ac", "1", "-c:a", "libmp3lame", "-b:a", "48k", template,
+    ])
+
+    segments = []
+    for i in range(count):
+        path = os.path.join(work_dir, f"segment_{i}.mp3")
+        shutil.copyfile(template, path)
+        segments.append(path)
+    return segments
+
+def time_merge(merge, segments, output_filename):
+    start = time.perf_counter()
+    merge(segments, output_filename)
+    elapsed = time.perf_counter() - start
+    return elapsed, os.path.getsize(output_filename)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--counts", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--segment-seconds", type=float, default=6.0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for count in args.counts:
+        work_dir = tempfile.mkdtemp(prefix="bench_merge_")
+        try:
+            segments = make_segments(work_dir, count, args.segment_seconds)
+            copy_seconds, copy_bytes = time_merge(concat_mp3_stream_copy, segments, os.path.join(work_dir, "copy.mp3"))
+            reencode_seconds, reencode_bytes = time_merge(concat_mp3_reencode, segments, os.path.join(work_dir, "reencode.mp3"))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        results.append({
+            "segments": count,
+            "episode_seconds": count * args.segment_seconds,
+            "stream_copy_seconds": round(copy_seconds, 3),
+            "reencode_seconds": round(reencode_seconds, 3),
+            "speedup": round(reencode_seconds / copy_seconds, 1) if copy_seconds else None,
+            "stream_copy_bytes": copy_bytes,
+            "reencode_bytes": reencode_bytes,
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'segments':>8} {'stream copy (s)':>16} {'re-encode (s)':>14} {'speedup':>8}")
+        for result in results:
+            print(f"{result['segments']:>8} {result['stream_copy_seconds']:>16} {result['reencode_seconds']:>14} {result['speedup']:>7}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Compare the lxml single-pass article extractor with the original BeautifulSoup (html.parser) one.
+
+Usage:
+    python benchmarks/bench_html_extract.py [--corpus DIR] [--repeat 5]
+    python benchmarks/bench_html_extract.py --fetch --corpus DIR   # Download live Wikipedia/news pages into DIR first
+
+The corpus is a directory of saved .html files plus a corpus.json mapping each file to its URL
+and, for pages that aren't real snapshots, "synthetic": true and the "layout" ("wikipedia" pages
+are extracted differently). The default corpus in benchmarks/fixtures/html_corpus is committed so
+results are reproducible offline. Its pages are synthetic: generated filler text in MediaWiki and
+news site layouts (navigation, references, ads and scripts), under example.org URLs. They are
+marked as such in the results; use --fetch for real pages. Pages are timed from memory, no network
+is involved.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import requests
+from bs4 import BeautifulSoup
+from article_extract import extract_article
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "html_corpus")
+
+DEFAULT_URLS = [
+    "https://en.wikipedia.org/wiki/Python_(programming_language)",
+    "https://en.wikipedia.org/wiki/World_War_II",
+    "https://en.wikipedia.org/wiki/Amazon_Web_Services",
+    "https://en.wikipedia.org/wiki/Podcast",
+    "https://www.bbc.com/news",
+    "https://www.theguardian.com/international",
+    "https://apnews.com/",
+    "https://www.npr.org/sections/news/",
+]
+
+def legacy_extract(html, url):
+    """The original BeautifulSoup extraction, kept as the baseline"""
+    soup = BeautifulSoup(html, 'html.parser')
+    formatted_text = ""
+
+    title = None
+    if 'wikipedia.org' in url:
+        heading = soup.find(id='firstHeading')
+        title = heading.get_text() if heading else None
+    else:
+        title_candidates = [
+            soup.find('meta', property='og:title'),
+            soup.find('meta', {'name': 'twitter:title'}),
+            soup.find('h1', {'class': lambda x: x and any(word in str(x).lower() for word in ['title', 'headline', 'post-title'])}),
+            soup.find('title'),
+        ]
+        for candidate in title_candidates:
+            if candidate:
+                title = candidate.get('content') if candidate.name == 'meta' else candidate.get_text()
+                if title:
+                    title = title.strip()
+                    break
+
+    if title:
+        formatted_text += f"{title.upper()}\n{'='*len(title)}\n\n"
+
+    if 'wikipedia.org' in url:
+        unwanted_sections = ['Navigation menu', 'References', 'External links', 'Contents', 'See also', 'Notes', 'Citations', 'Bibliography']
+        for ref in soup.find_all('sup', {'class': 'reference'}):
+            ref.decompose()
+        for ref in soup.find_all('a', {'class': 'reference'}):
+            ref.decompose()
+        for edit in soup.find_all('span', {'class': 'mw-editsection'}):
+            edit.decompose()
+
+        content = soup.find('div', {'id': 'mw-content-text'})
+        if content:
+            for section in content.find_all(['h2', 'h3', 'p', 'ul', 'ol']):
+                section_text = section.get_text().strip()
+                if any(unwanted in section_text for unwanted in unwanted_sections):
+                    continue
+                if section.name in ['h2', 'h3']:
+                    formatted_text += f"\n{section_text.upper()}\n{'='*len(section_text)}\n\n"
+                elif section.name == 'p' and len(section_text) > 20:
+                    formatted_text += f"{section_text}\n\n"
+                elif section.name in ['ul', 'ol']:
+                    for li in section.find_all('li'):
+                        li_text = li.get_text().strip()
+                        if li_text:
+                            formatted_text += f"  • {li_text}\n"
+                    formatted_text += "\n"
+    else:
+        unwanted_elements = [
+            'header', 'footer', 'nav', 'aside', 'script', 'style',
+            'noscript', 'iframe', 'ad', 'advertisement', 'comments',
+            'sidebar', 'menu', 'social-links', 'related-posts'
+        ]
+        for element in soup.find_all(class_=lambda x: x and any(word in str(x).lower() for word in unwanted_elements)):
+            element.decompose()
+        for tag in soup.find_all(['script', 'style', 'nav', 'header', 'footer', 'aside']):
+            tag.decompose()
+
+        main_content = None
+        possible_content_elements = [
+            soup.find('article'),
+            soup.find('main'),
+            soup.find(class_=lambda x: x and 'content' in str(x).lower()),
+            soup.find(id=lambda x: x and 'content' in str(x).lower()),
+            soup.find('div', class_=lambda x: x and ('post' in str(x).lower() or 'article' in str(x).lower()))
+        ]
+        for element in possible_content_elements:
+            if element:
+                main_content = element
+                break
+        if not main_content:
+            main_content = soup.find('body')
+
+        if main_content:
+            for heading in main_content.find_all(['h1', 'h2', 'h3']):
+                text = heading.get_text().strip()
+                if text and text != title:
+                    formatted_text += f"\n{text.upper()}\n{'='*len(text)}\n\n"
+            for element in main_content.find_all(['p', 'ul', 'ol']):
+                if element.name == 'p':
+                    text = element.get_text().strip()
+                    if text and len(text) > 20:
+                        formatted_text += f"{text}\n\n"
+                elif element.name in ['ul', 'ol']:
+                    for li in element.find_all('li'):
+                        text = li.get_text().strip()
+                        if text:
+                            formatted_text += f"  • {text}\n"
+                    formatted_text += "\n"
+
+    formatted_text = re.sub(r'$$[\d\s,]+$$', '', formatted_text)
+    formatted_text = re.sub(r'\n\s*\n', '\n\n', formatted_text)
+    formatted_text = re.sub(r'\s+', ' ', formatted_text)
+    return '\n'.join(line.strip() for line in formatted_text.splitlines() if line.strip())
+
+def fetch_corpus(corpus_dir, urls):
+    """Download urls into corpus_dir and record them in corpus.json"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    manifest_path = os.path.join(corpus_dir, "corpus.json")
+    manifest = load_manifest(corpus_dir)
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+
+    for url in urls:
+        name = re.sub(r"[^A-Za-z0-9]+", "_", url.split("://", 1)[-1]).strip("_")[:100] + ".html"
+        try:
+            response = requests.get(url, headers=headers, timeout=30)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"Skipping {url}: {e}")
+            continue
+        with open(os.path.join(corpus_dir, name), "wb") as html_file:
+            html_file.write(response.content)
+        manifest[name] = {"url": url}
+        print(f"Saved {url} ({len(response.content) / 1024:.0f} KB)")
+
+    with open(manifest_path, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+def load_manifest(corpus_dir):
+    """Return {file name: {"url", "layout", "synthetic"}}, accepting plain URL entries too"""
+    manifest_path = os.path.join(corpus_dir, "corpus.json")
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    return {name: entry if isinstance(entry, dict) else {"url": entry} for name, entry in manifest.items()}
+
+def extract_url(name, entry):
+    """The URL handed to the extractors, which recognise Wikipedia pages by their URL"""
+    if entry.get("layout") == "wikipedia" or (not entry and "wikipedia" in name):
+        return "https://en.wikipedia.org/"
+    return entry.get("url", "")
+
+def time_extract(extract, html, url, repeat):
+    """Return the best time of repeat runs and the extracted text"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = extract(html, url)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, text
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Directory of saved .html files")
+    parser.add_argument("--fetch", action="store_true", help="Download the default live pages into the corpus first, to refresh or extend it")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    if args.fetch:
+        fetch_corpus(args.corpus, DEFAULT_URLS)
+
+    if not os.path.isdir(args.corpus):
+        sys.exit(f"No corpus at {args.corpus}, point --corpus at saved HTML files or add --fetch")
+
+    manifest = load_manifest(args.corpus)
+    results = []
+    for name in sorted(os.listdir(args.corpus)):
+        if not name.endswith((".html", ".htm")):
+            continue
+        with open(os.path.join(args.corpus, name), "rb") as html_file:
+            html = html_file.read()
+        # Without a manifest entry, Wikipedia pages are recognised by their file name
+        entry = manifest.get(name, {})
+        url = extract_url(name, entry)
+
+        legacy_seconds, legacy_text = time_extract(legacy_extract, html, url, args.repeat)
+        lxml_seconds, lxml_text = time_extract(extract_article, html, url, args.repeat)
+        results.append({
+            "page": name,
+            "synthetic": bool(entry.get("synthetic")),
+            "kilobytes": round(len(html) / 1024),
+            "legacy_seconds": round(legacy_seconds, 4),
+            "lxml_seconds": round(lxml_seconds, 4),
+            "speedup": round(legacy_seconds / lxml_seconds, 1) if lxml_seconds else None,
+            "legacy_chars": len(legacy_text),
+            "lxml_chars": len(lxml_text),
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'page':<50} {'KB':>6} {'legacy (s)':>11} {'lxml (s)':>9} {'speedup':>8}")
+        for result in results:
+            page = result['page'] + (" *" if result['synthetic'] else "")
+            print(f"{page[:50]:<50} {result['kilobytes']:>6} {result['legacy_seconds']:>11} {result['lxml_seconds']:>9} {result['speedup']:>7}x")
+        if any(result['synthetic'] for result in results):
+            print("* Synthetic page (generated text in a real site's layout), not a snapshot of a real page")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Time every stage of the episode pipeline offline, with Bedrock and Polly replaced by local stand-ins.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--repeat 3] [--media audio] [--stubs stubs.json] [--output results.json]
+    python benchmarks/bench_pipeline.py --baseline results.json [--threshold 0.2]   # Exit 1 on a regression
+
+The fixtures in benchmarks/fixtures are run through run_episode: document.txt as a document,
+article.html served by a local HTTP server as a URL, and script.txt as an existing script. The stubs
+sleep for a log-normal latency, throttle a share of the calls and return canned payloads: the fixture
+script, a synthetic PNG and silent MP3s as long as the text would take to speak. Every cache starts
+empty and episodes are always regenerated, so runs are comparable. ffmpeg is needed on the PATH.
+Run it with SCRIPT_STREAMING=1 to measure the streamed script, whose stub latency arrives chunk by chunk.
+
+Stub settings (--stubs JSON, merged over DEFAULT_STUBS) per operation:
+    median     Median latency in seconds.
+    sigma      Spread of the log-normal latency (0 for a fixed latency).
+    per_kchar  Extra seconds per 1000 characters of input (Polly).
+    throttle   Share of calls that fail with ThrottlingException.
+"""
+import argparse
+import base64
+import functools
+import http.server
+import io
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+sys.path.insert(0, REPO_DIR)
+
+DEFAULT_STUBS = {
+    "converse": {"median": 4.0, "sigma": 0.2, "throttle": 0.0},
+    "converse_stream": {"median": 4.0, "sigma": 0.2, "throttle": 0.0},
+    "invoke_model": {"median": 3.0, "sigma": 0.2, "throttle": 0.05},
+    "synthesize_speech": {"median": 0.4, "sigma": 0.3, "per_kchar": 0.3, "throttle": 0.02},
+}
+
+# Speaking rate used to size the synthetic MP3s
+WORDS_PER_SECOND = 2.5
+
+FIXTURES = [
+    {"name": "document", "source": "Document", "file": "document.txt"},
+    {"name": "url", "source": "URL", "file": "article.html"},
+    {"name": "script", "source": "Existing Script", "file": "script.txt"},
+]
+
+def isolate_caches(root):
+    """Point every cache and the workspaces at an empty directory, before the app modules are imported"""
+    for name, directory in [("EPISODE_CACHE_DIR", "episodes"), ("FETCH_CACHE_DIR", "http"), ("IMAGE_ASSET_DIR", "images"),
+                            ("DOC_INDEX_DIR", "doc_index"), ("WORKSPACE_ROOT", "jobs"), ("TTS_CACHE_DIR", "tts")]:
+        os.environ[name] = os.path.join(root, directory)
+    os.environ["TTS_CACHE_MAX_MB"] = "0"  # Every line is synthesized
+    os.environ.setdefault("PROGRESSIVE_PLAYBACK", "0")  # Nobody is listening
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+class StubLatency:
+    """Sleeps and throttles like a remote service, from one operation's settings"""
+
+    def __init__(self, operation, settings, seed):
+        self.operation = operation
+        self.settings = settings
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def wait(self, chars=0):
+        """Sleep for one call, raising ThrottlingException for the configured share of calls"""
+        time.sleep(self.latency(chars))
+
+    def latency(self, chars=0):
+        """Draw the latency of one call without sleeping it, raising ThrottlingException like wait"""
+        from botocore.exceptions import ClientError
+
+        with self._lock:
+            self.calls += 1
+            throttle = self.random.random() < self.settings.get("throttle", 0.0)
+            latency = self.settings["median"] * math.exp(self.random.gauss(0, self.settings.get("sigma", 0.0)))
+        latency += self.settings.get("per_kchar", 0.0) * chars / 1000
+
+        if throttle:
+            with self._lock:
+                self.throttled += 1
+            time.sleep(min(latency, 0.05))
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded (stub)"}}, self.operation)
+        return latency
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "throttled": self.throttled}
+
+class StubBedrock:
+    """converse, converse_stream and invoke_model (Nova Canvas) with canned payloads"""
+
+    def __init__(self, stubs, script, image_bytes, seed):
+        self.latency = {operation: StubLatency(operation, stubs[operation], seed + i) for i, operation in enumerate(("converse", "converse_stream", "invoke_model"))}
+        self.script = script
+        self.image_bytes = image_bytes
+
+    def converse(self, modelId, messages, **kwargs):
+        self.latency["converse"].wait()
+        return {"output": {"message": {"role": "assistant", "content": [{"text": self.script}]}}}
+
+    def converse_stream(self, modelId, messages, **kwargs):
+        latency = self.latency["converse_stream"].latency()  # Opening the stream may throttle
+        pieces = [self.script[start:start + 40] for start in range(0, len(self.script), 40)]
+
+        def events():
+            # The latency is spread over the stream like tokens arriving, so lines are voiced while the rest is written
+            for piece in pieces:
+                time.sleep(latency / len(pieces))
+                yield {"contentBlockDelta": {"delta": {"text": piece}}}
+
+        return {"stream": events()}
+
+    def invoke_model(self, body, modelId, **kwargs):
+        self.latency["invoke_model"].wait()
+        payload = {"images": [base64.b64encode(self.image_bytes).decode("ascii")], "error": None}
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+
+class StubPolly:
+    """synthesize_speech returning silent MP3 (or PCM) audio as long as the text takes to speak"""
+
+    def __init__(self, stubs, seed):
+        self.latency = {"synthesize_speech": StubLatency("synthesize_speech", stubs["synthesize_speech"], seed)}
+        self._mp3 = {}
+        self._lock = threading.Lock()
+
+    def silent_mp3(self, seconds):
+        """A silent 24 kHz mono MP3, generated once per length"""
+        from media import run_ffmpeg
+
+        with self._lock:
+            if seconds not in self._mp3:
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    path = os.path.join(tmp_dir, "silence.mp3")
+                    run_ffmpeg(["-f", "lavfi", "-i", "anullsrc=r=24000:cl=mono", "-t", str(seconds), "-c:a", "libmp3lame", "-b:a", "48k", path])
+                    with open(path, "rb") as mp3_file:
+                        self._mp3[seconds] = mp3_file.read()
+            return self._mp3[seconds]
+
+    def synthesize_speech(self, Text, OutputFormat, SampleRate=None, **kwargs):
+        self.latency["synthesize_speech"].wait(len(Text))
+        seconds = max(1, round(len(Text.split()) / WORDS_PER_SECOND))
+        if OutputFormat == "pcm":
+            audio = bytes(int(SampleRate or 16000) * 2 * seconds)
+        else:
+            audio = self.silent_mp3(seconds)
+        return {"AudioStream": io.BytesIO(audio)}
+
+def make_png():
+    """A 1024x1024 PNG like the ones Nova Canvas returns"""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (1024, 1024), (30, 60, 120))
+    ImageDraw.Draw(image).ellipse((256, 256, 768, 768), fill=(240, 200, 80))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+def serve_fixtures():
+    """Serve the fixtures directory on a local port, returns the server (its URL base is server.url)"""
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=FIXTURES_DIR))
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def run_fixture(runner, fixture, media_option, base_url):
+    """Run one episode and return its wall time, per-stage timings and time by span, raising if it failed"""
+    from episode import run_episode
+    from metrics import trace_summary
+
+    kwargs = {"source": fixture["source"], "media_option": media_option, "force_regenerate": True}
+    if fixture["source"] == "URL":
+        kwargs["url"] = f"{base_url}/{fixture['file']}"
+    else:
+        with open(os.path.join(FIXTURES_DIR, fixture["file"]), "rb") as fixture_file:
+            kwargs["document_bytes"] = fixture_file.read()
+        kwargs["document_name"] = fixture["file"]
+
+    started = time.perf_counter()
+    job = runner.submit(run_episode, **kwargs)
+    while not job.done():
+        time.sleep(0.05)
+    seconds = time.perf_counter() - started
+
+    snapshot = job.snapshot()
+    spans = trace_summary(job.job_id)
+    runner.discard(job.job_id)
+    if snapshot["status"] != "succeeded":
+        raise RuntimeError(f"{fixture['name']} episode {snapshot['status']}: {snapshot['error']}")
+    return seconds, snapshot["stage_timings"], spans
+
+def compare(results, baseline, threshold, min_delta):
+    """Return the regressions of results against baseline: stages slower by more than threshold and min_delta seconds"""
+    regressions = []
+    for name, result in results["fixtures"].items():
+        previous = baseline.get("fixtures", {}).get(name)
+        if not previous:
+            continue
+        timings = dict(result["stages"], total=result["total"])
+        previous_timings = dict(previous["stages"], total=previous["total"])
+        for stage, seconds in timings.items():
+            before = previous_timings.get(stage)
+            if before is not None and seconds > before * (1 + threshold) and seconds - before > min_delta:
+                change = f" (+{seconds / before - 1:.0%})" if before else ""
+                regressions.append(f"{name}/{stage}: {before:.2f}s -> {seconds:.2f}s{change}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Episodes per fixture, the median is reported")
+    parser.add_argument("--media", choices=["audio", "video"], default="audio")
+    parser.add_argument("--fixtures", nargs="+", choices=[fixture["name"] for fixture in FIXTURES], help="Only run these fixtures")
+    parser.add_argument("--stubs", help="JSON file with stub settings, merged over the defaults")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply every stub latency, e.g. 0.1 for a quick run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--baseline", help="Earlier JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown per stage, as a fraction")
+    parser.add_argument("--min-delta", type=float, default=0.25, help="Slowdowns shorter than this many seconds are noise")
+    args = parser.parse_args()
+
+    stubs = {operation: dict(settings) for operation, settings in DEFAULT_STUBS.items()}
+    if args.stubs:
+        with open(args.stubs, encoding="utf-8") as stubs_file:
+            for operation, settings in json.load(stubs_file).items():
+                stubs.setdefault(operation, {}).update(settings)
+    for settings in stubs.values():
+        settings["median"] *= args.latency_scale
+        settings["per_kchar"] = settings.get("per_kchar", 0.0) * args.latency_scale
+
+    cache_root = tempfile.mkdtemp(prefix="bench_pipeline_")
+    isolate_caches(cache_root)
+
+    # Imported only now, the modules read their settings from the environment
+    import episode
+    from jobs import JobRunner
+
+    with open(os.path.join(FIXTURES_DIR, "script.txt"), encoding="utf-8") as script_file:
+        script = script_file.read()
+    bedrock = StubBedrock(stubs, script, make_png(), args.seed)
+    polly = StubPolly(stubs, args.seed + 10)
+    episode.client = bedrock
+    episode.polly_client = polly
+
+    server = serve_fixtures()
+    runner = JobRunner(max_jobs=1)
+    media_option = args.media.capitalize()
+    fixtures = [fixture for fixture in FIXTURES if not args.fixtures or fixture["name"] in args.fixtures]
+
+    results = {"media": media_option, "repeat": args.repeat, "stubs": stubs, "fixtures": {}}
+    try:
+        for fixture in fixtures:
+            totals = []
+            stage_samples = {}
+            for _ in range(args.repeat):
+                seconds, stage_timings, spans = run_fixture(runner, fixture, media_option, server.url)
+                totals.append(seconds)
+                for stage, stage_seconds in stage_timings.items():
+                    stage_samples.setdefault(stage, []).append(stage_seconds)
+
+            results["fixtures"][fixture["name"]] = {
+                "total": round(statistics.median(totals), 3),
+                "stages": {stage: round(statistics.median(samples), 3) for stage, samples in stage_samples.items()},
+                "samples": {"total": [round(seconds, 3) for seconds in totals]},
+                "spans": spans,  # (count, seconds) per span name, from the last run
+            }
+    finally:
+        server.shutdown()
+
+    results["stub_calls"] = {operation: latency.stats() for stubs_object in (bedrock, polly) for operation, latency in stubs_object.latency.items()}
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold, args.min_delta)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+        print(f"No stage regressed by more than {args.threshold:.0%} against {args.baseline}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compare the still-image ffmpeg encoder with the moviepy compose path, whole and in parallel parts.
+
+Usage:
+    python benchmarks/bench_video_encode.py [--minutes 1 5 15] [--images 1] [--workers 4]
+
+The input is a synthetic 1024x1024 PNG (the Nova Canvas size) and a 24 kHz mono MP3 of the given length.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image, ImageDraw
+from media import encode_still_video, encode_video_moviepy, encode_video_segmented, plan_slides, run_ffmpeg
+
+def make_inputs(work_dir, minutes, image_count):
+    """Create image_count synthetic images and an MP3 of the given length"""
+    image_paths = []
+    for i in range(image_count):
+        image = Image.new("RGB", (1024, 1024), (30 + 40 * i, 60, 120))
+        ImageDraw.Draw(image).ellipse((256, 256, 768, 768), fill=(240, 200, 80))
+        path = os.path.join(work_dir, f"image_{i}.png")
+        image.save(path)
+        image_paths.append(path)
+
+    audio_path = os.path.join(work_dir, "podcast.mp3")
+    run_ffmpeg([
+        "-f", "lavfi", "-i", f"sine=frequency=220:duration={minutes * 60}",
+        "-ar", "24000", "-ac", "1", "-c:a", "libmp3lame", "-b:a", "48k", audio_path,
+    ])
+    return image_paths, audio_path
+
+def time_encode(encode, slides, audio_path, output_path):
+    start = time.perf_counter()
+    encode(slides, audio_path, output_path)
+    elapsed = time.perf_counter() - start
+    return elapsed, os.path.getsize(output_path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 5, 15])
+    parser.add_argument("--images", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes for the segmented moviepy encode")
+    parser.add_argument("--skip-moviepy", action="store_true", help="Only time the still-image path")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    # Same setup as the app: spawned worker processes, one part per worker
+    pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"))
+    run_cpu = lambda fn, *fn_args: pool.submit(fn, *fn_args).result()
+    segmented = lambda slides, audio_path, output_path: encode_video_segmented(slides, audio_path, output_path, segments=args.workers, run_cpu=run_cpu)
+
+    results = []
+    for minutes in args.minutes:
+        work_dir = tempfile.mkdtemp(prefix="bench_video_")
+        try:
+            image_paths, audio_path = make_inputs(work_dir, minutes, args.images)
+            slides = plan_slides(image_paths, minutes * 60)
+
+            still_seconds, still_bytes = time_encode(encode_still_video, slides, audio_path, os.path.join(work_dir, "still.mp4"))
+            moviepy_seconds = moviepy_bytes = segmented_seconds = None
+            if not args.skip_moviepy:
+                moviepy_seconds, moviepy_bytes = time_encode(encode_video_moviepy, slides, audio_path, os.path.join(work_dir, "moviepy.mp4"))
+                segmented_seconds, _ = time_encode(segmented, slides, audio_path, os.path.join(work_dir, "segmented.mp4"))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        results.append({
+            "audio_minutes": minutes,
+            "images": args.images,
+            "still_seconds": round(still_seconds, 2),
+            "moviepy_seconds": round(moviepy_seconds, 2) if moviepy_seconds else None,
+            "speedup": round(moviepy_seconds / still_seconds, 1) if moviepy_seconds else None,
+            "workers": args.workers,
+            "segmented_seconds": round(segmented_seconds, 2) if segmented_seconds else None,
+            "segmented_speedup": round(moviepy_seconds / segmented_seconds, 1) if segmented_seconds else None,
+            "still_bytes": still_bytes,
+            "moviepy_bytes": moviepy_bytes,
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'minutes':>8} {'still (s)':>10} {'moviepy (s)':>12} {'speedup':>8} {'segmented (s)':>14} {'vs moviepy':>11}")
+        for result in results:
+            print(f"{result['audio_minutes']:>8} {result['still_seconds']:>10} {str(result['moviepy_seconds']):>12} {str(result['speedup']):>7}x"
+                  f" {str(result['segmented_seconds']):>14} {str(result['segmented_speedup']):>10}x")
+    pool.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,8 @@ class AppStack(Stack):
         docker_image_asset = ecr_assets.DockerImageAsset(self, "MyDockerImage",
             directory=docker_context_path,
             platform=ecr_assets.Platform.LINUX_AMD64,
+            # The Dockerfile verifies the vendored hls.js against this digest: cdk deploy -c hls_js_sha256=<digest>
+            build_args={"HLS_JS_SHA256": self.node.try_get_context("hls_js_sha256") or ""},
             exclude=["cdk", "cdk.out", ".git", "__pycache__", "*.pyc"]
         )
 
@@ -96,6 +98,8 @@ class AppStack(Stack):
         # Add container with logging
         container = task_definition.add_container("MyContainer",
             image=ecs.ContainerImage.from_docker_image_asset(docker_image_asset),
+            # Stage, AWS call and TTS metrics as Embedded Metric Format lines, extracted from the log group below
+            environment={"METRICS_EMF": "1", "METRICS_NAMESPACE": "DocTalk"},
             logging=ecs.LogDrivers.aws_logs(
                 stream_prefix="app",
                 log_group=logs.LogGroup(
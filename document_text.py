@@ -0,0 +1,276 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PyPDF2 import PdfReader
+import docx
+
+# Processes that extract PDF page ranges (and DOCX files) off the UI thread
+DOC_EXTRACT_WORKERS = int(os.environ.get("DOC_EXTRACT_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+# Pages per extraction task, the first task only covers the preview so it comes back first
+DOC_PAGES_PER_TASK = int(os.environ.get("DOC_PAGES_PER_TASK", "20"))
+DOC_PREVIEW_PAGES = int(os.environ.get("DOC_PREVIEW_PAGES", "10"))
+
+# Complete page indexes are kept here, so later stages and reruns read pages without re-parsing
+DOC_INDEX_DIR = os.environ.get("DOC_INDEX_DIR", "/tmp/doctalk/doc_index")
+DOC_INDEX_MAX_BYTES = int(float(os.environ.get("DOC_INDEX_MAX_MB", "256")) * 1024 * 1024)
+
+# Indexes kept in memory, including the ones still being extracted
+DOC_INDEX_MEMORY_ENTRIES = 16
+
+# Rough page size used to page formats without real pages (DOCX, TXT)
+CHARS_PER_PAGE = 3000
+
+def extract_pdf_pages(pdf_path, start, end):
+    """Extract the text of PDF pages start..end-1 (runs in a worker process)"""
+    reader = PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+def extract_docx_text(docx_path):
+    """Extract the paragraphs of a DOCX (runs in a worker process)"""
+    document = docx.Document(docx_path)
+    return "\n".join(paragraph.text for paragraph in document.paragraphs)
+
+def split_pages(text, chars_per_page=CHARS_PER_PAGE):
+    """Cut text without real pages into pages of about chars_per_page, on line boundaries"""
+    pages = []
+    current = []
+    current_size = 0
+    for line in text.split("\n"):
+        if current and current_size + len(line) > chars_per_page:
+            pages.append("\n".join(current))
+            current = []
+            current_size = 0
+        current.append(line)
+        current_size += len(line) + 1
+    if current:
+        pages.append("\n".join(current))
+    return pages or [""]
+
+def document_key(document_bytes):
+    return hashlib.sha256(document_bytes).hexdigest()
+
+class DocumentIndex:
+    """
+    The text of a document, page by page.
+
+    Pages are filled in as extraction tasks finish, in any order. Readers can show the pages that
+    are ready (the preview), wait for more, or wait for the whole document. Once every page is in,
+    the index is saved to the index directory and reused for the same document bytes.
+    """
+
+    def __init__(self, key, page_count=None, pages=None):
+        self.key = key
+        self.page_count = page_count
+        self.pages = pages if pages is not None else [None] * (page_count or 0)
+        self.error = None
+        self._ready = threading.Condition()
+
+    def set_page_count(self, page_count):
+        with self._ready:
+            self.page_count = page_count
+            self.pages = [None] * page_count
+            self._ready.notify_all()
+
+    def add(self, start, texts):
+        """Store the text of pages start..start+len(texts)-1"""
+        with self._ready:
+            self.pages[start:start + len(texts)] = texts
+            self._ready.notify_all()
+
+    def fail(self, error):
+        with self._ready:
+            self.error = error
+            self._ready.notify_all()
+
+    def pages_done(self):
+        """Number of pages extracted so far"""
+        with self._ready:
+            return sum(1 for page in self.pages if page is not None)
+
+    def done(self):
+        with self._ready:
+            return self.error is not None or (self.page_count is not None and None not in self.pages)
+
+    def wait(self, pages=None, timeout=None):
+        """
+        Wait until the first pages pages (all of them by default) are extracted.
+        Returns:
+            ready (bool): False on timeout. Extraction errors are raised.
+        """
+        def ready():
+            if self.error is not None or self.page_count is None:
+                return self.error is not None
+            wanted = self.page_count if pages is None else min(pages, self.page_count)
+            return None not in self.pages[:wanted]
+
+        with self._ready:
+            finished = self._ready.wait_for(ready, timeout)
+            if self.error is not None:
+                raise self.error
+            return finished
+
+    def page(self, number):
+        """The text of a page (0-based), or None while it is being extracted"""
+        with self._ready:
+            return self.pages[number]
+
+    def text(self, start=0, end=None):
+        """The text of pages start..end-1 that are ready so far"""
+        with self._ready:
+            return "\n".join(page for page in self.pages[start:end] if page is not None)
+
+def index_path(key):
+    return os.path.join(DOC_INDEX_DIR, f"{key}.json")
+
+def load_index(key):
+    """Return the saved index of a document, or None"""
+    path = index_path(key)
+    try:
+        with open(path, encoding="utf-8") as index_file:
+            pages = json.load(index_file)["pages"]
+        os.utime(path)  # Mark as recently used
+    except (OSError, ValueError, KeyError):
+        return None
+    return DocumentIndex(key, len(pages), pages)
+
+def save_index(index):
+    """Save a complete index atomically, best effort"""
+    os.makedirs(DOC_INDEX_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=DOC_INDEX_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+            json.dump({"pages": index.pages}, tmp_file)
+        os.replace(tmp_path, index_path(index.key))
+    except OSError as e:
+        print(f"Unable to save the page index of {index.key}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    evict_indexes()
+
+def evict_indexes(max_bytes=DOC_INDEX_MAX_BYTES):
+    """Remove least-recently-used saved indexes until the directory fits in max_bytes"""
+    entries = []
+    for entry in os.scandir(DOC_INDEX_DIR):
+        if not entry.name.endswith(".json"):
+            continue  # Write in progress
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+_pool = None
+_indexes = OrderedDict()  # Key -> DocumentIndex, most recently used last
+_lock = threading.Lock()
+
+def get_extract_pool():
+    """Return the process pool shared by every document extraction"""
+    global _pool
+    with _lock:
+        if _pool is None:
+            # Spawned (not forked) workers, like the job CPU pool
+            _pool = ProcessPoolExecutor(max_workers=DOC_EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def page_ranges(page_count, preview_pages=DOC_PREVIEW_PAGES, pages_per_task=DOC_PAGES_PER_TASK):
+    """The (start, end) page ranges of the extraction tasks, the preview first"""
+    bounds = [0] + list(range(min(preview_pages, page_count), page_count, pages_per_task)) + [page_count]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def run_extraction(index, document_bytes, file_extension):
+    """Fill index from the document (runs on a background thread)"""
+    tmp_path = None
+    try:
+        if file_extension == "txt":
+            pages = split_pages(document_bytes.decode("utf-8", errors="replace"))
+            index.set_page_count(len(pages))
+            index.add(0, pages)
+        else:
+            # Workers read the document from disk rather than receiving a copy of its bytes per task
+            fd, tmp_path = tempfile.mkstemp(suffix=f".{file_extension}")
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(document_bytes)
+
+            pool = get_extract_pool()
+            if file_extension == "pdf":
+                # Only the cross-reference table is read here, no page is parsed
+                index.set_page_count(len(PdfReader(io.BytesIO(document_bytes)).pages))
+                futures = {pool.submit(extract_pdf_pages, tmp_path, start, end): start for start, end in page_ranges(index.page_count)}
+                for future in as_completed(futures):
+                    index.add(futures[future], future.result())
+            elif file_extension == "docx":
+                pages = split_pages(pool.submit(extract_docx_text, tmp_path).result())
+                index.set_page_count(len(pages))
+                index.add(0, pages)
+            else:
+                raise ValueError(f"Unsupported document type: {file_extension}")
+    except Exception as e:
+        print(f"Unable to extract the text of document {index.key[:12]}: {e}")
+        index.fail(e)
+        return
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    save_index(index)
+
+def open_document(document_bytes, file_extension):
+    """
+    Return the page index of a document, starting its extraction in the background if needed.
+    Args:
+        document_bytes (bytes): The PDF, DOCX or TXT file.
+        file_extension (str): "pdf", "docx" or "txt".
+    Returns:
+        index (DocumentIndex): May still be filling, use wait() for the pages you need.
+
+    The same document bytes always get the same index: from memory, from the index directory
+    (no parsing at all) or from a single extraction shared by every caller.
+    """
+    key = document_key(document_bytes)
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None:
+            # Failed extractions are kept too, so the error is shown instead of extracting again on every rerun
+            _indexes.move_to_end(key)
+            return index
+
+        index = load_index(key)
+        start = index is None
+        if start:
+            index = DocumentIndex(key)
+        _indexes[key] = index
+        while len(_indexes) > DOC_INDEX_MEMORY_ENTRIES:
+            _indexes.popitem(last=False)
+
+    if start:
+        threading.Thread(target=run_extraction, args=(index, document_bytes, file_extension.lower()), daemon=True).start()
+    return index
+
+def get_document_index(key):
+    """Return an index opened earlier by open_document, or None"""
+    with _lock:
+        return _indexes.get(key)
+
+def document_text(document_bytes, file_extension):
+    """The full text of a document, read from its page index (pages joined by newlines)"""
+    index = open_document(document_bytes, file_extension)
+    index.wait()
+    return index.text()
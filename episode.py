@@ -0,0 +1,994 @@
+import json
+import os
+import base64
+import re
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from aws_clients import connection_stats, get_client
+from metrics import record_bytes, span, trace_summary, with_trace
+from rate_limit import call_with_limits, is_throttling, limiter_stats
+from tts_cache import TTSCache, get_tts_cache
+from episode_cache import EpisodeCache, get_episode_cache, link_or_copy
+from image_assets import get_image_asset_cache, prepare_image_asset
+from http_fetch import FetchError, fetch_url
+from article_extract import extract_article
+from document_text import open_document
+from token_budget import PREPROCESS_MIN_SAVINGS, prepare_text
+from workspace import workspace_file
+from speech_plan import SpeechPlanner
+from pipeline import Pipeline
+from jobs import JOB_CPU_WORKERS
+from progressive import PROGRESSIVE_PLAYBACK, open_stream
+from map_reduce import MIN_PAGES as map_reduce_min_pages, estimate_pages, generate_script_map_reduce, split_document
+from media import (MediaError, OrderedPcmWriter, concat_mp3_reencode, concat_mp3_stream_copy, encode_mp3,
+                   encode_still_track, encode_still_video, encode_video_segmented, mux_video_audio, plan_slides, probe_duration)
+
+# Initialize the Bedrock client (shared, pooled and reused across sessions)
+client = get_client("bedrock-runtime")
+
+# Initialize Polly client
+polly_client = get_client('polly', region_name='us-east-1')
+
+# modelId="anthropic.claude-3-sonnet-20240229-v1:0"
+# modelId="anthropic.claude-3-5-sonnet-20240620-v1:0"
+# modelId="us.anthropic.claude-3-5-sonnet-20241022-v2:0"
+modelId="us.amazon.nova-lite-v1:0"
+# modelId="us.meta.llama3-2-90b-instruct-v1:0"
+# modelId="meta.llama3-2-3b-instruct-v1:0"
+
+model_ids = ['us.amazon.nova-lite-v1:0', 'us.amazon.nova-lite-v1:0', 'us.meta.llama3-2-90b-instruct-v1:0', 'us.anthropic.claude-3-5-sonnet-20241022-v2:0', 'anthropic.claude-3-sonnet-20240229-v1:0']
+
+# Maximum number of Polly requests kept in flight while synthesizing a script
+polly_max_in_flight = int(os.environ.get("POLLY_MAX_IN_FLIGHT", "8"))
+
+# How merge_audio_files joins the per-line MP3s: "copy" (stream copy, no re-encode) or "reencode" (pydub)
+audio_merge_mode = os.environ.get("AUDIO_MERGE_MODE", "copy")
+
+# How process_script requests audio: "mp3" (one MP3 per line) or "pcm" (raw PCM assembled into one WAV, encoded once)
+audio_output_mode = os.environ.get("AUDIO_OUTPUT_MODE", "mp3")
+pcm_sample_rate = int(os.environ.get("PCM_SAMPLE_RATE", "16000"))  # Polly supports 8000 or 16000 for PCM
+pcm_turn_gap_ms = int(os.environ.get("PCM_TURN_GAP_MS", "0"))  # Silence inserted between turns in PCM mode
+
+# Generate the script with converse_stream and synthesize lines while it is still being written
+script_streaming = os.environ.get("SCRIPT_STREAMING", "0") == "1"
+
+# How the video is encoded: "still" (ffmpeg still-image fast path) or "moviepy" (composite at 24 fps)
+video_encode_mode = os.environ.get("VIDEO_ENCODE_MODE", "still")
+
+# Parts the moviepy video is split into and encoded in parallel (one per CPU worker by default)
+video_segments = int(os.environ.get("VIDEO_SEGMENTS", str(JOB_CPU_WORKERS)))
+
+# Slowest speaking rate expected from Polly, used to size a video track rendered before the audio exists
+min_words_per_second = 2.0
+
+# Instructions for the podcast script, prefixed with what is being converted (see build_system_prompt)
+SCRIPT_PROMPT = """
+        into a natural, engaging, and extensive podcast script featuring a conversation between **two hosts**. 
+        Go through each page of the document and extract the insights to create the podcast script. Do not miss any pages while creating the podcast script.
+        The dialogue should flow naturally, with dynamic interaction between the hosts, including pauses, gaps, and natural breaks,
+        to make the conversation feel lively and authentic—perfect for an audio format.
+        The conversation should be lively, dynamic, and keep the listener's attention, with smooth transitions and natural pauses.
+
+        ### Key Instructions:
+        1. **Summarize the article in one sentence** and make that the podcast **title**.
+        2. **Introduction** Always have the first line of the Podcast script as "Welcome to the DocTalk show! I’m Rachel, and my co-host Tom, here to dive into the fascinating world of documents and articles, bringing them to life as engaging DocTalk conversations."
+        2. **Mention the podcast title** at the beginning of the script and throughout the conversation where appropriate. Make sure it feels integrated naturally, not forced.
+        3. **Ensure that the core message and essence** of the original content are preserved while adapting it into a dialogue. Every important point in the document must be covered, with a balance between thoroughness and natural conversation flow.
+        4. **Format**: Use dialogue between **Speaker 1** and **Speaker 2**. Don't mention the speaker names in the script. Alternate between them in a way that keeps the conversation dynamic and engaging.
+        5. **Pacing**: Include natural pauses, slight pauses, and breaks to make the conversation sound authentic and suited for an audio format.
+        6. Avoid using words like 'pause,' 'wrapping up,' 'interjecting,' 'enthusiastically,' or any other terms that describe actions or tones
+
+        ### Example Format:
+        **Title:** [Podcast Title]  
+        **Speaker 1:** Welcome back to [Podcast Title].  
+        **Speaker 2:** Thanks for joining us. Today, we’ll be discussing [main point of the document].  
+        **Speaker 1:** That's right. We'll explore [main point] in more detail here on [Podcast Title].  
+        **Speaker 2:** This is an important topic to explore. Let’s dive in.
+
+        Feel free to adapt the tone based on the subject matter, whether it’s more casual and friendly or informative and serious. Ensure the script reads as a natural conversation, with both hosts actively engaging with each other and maintaining a lively flow.
+        """
+
+# Define ImageError exception
+class ImageError(Exception):
+    """Custom exception for image generation errors."""
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+# Define SpeechError exception
+class SpeechError(Exception):
+    """Custom exception for speech synthesis errors."""
+    def __init__(self, message, failed_lines=None):
+        self.message = message
+        self.failed_lines = failed_lines or []
+        super().__init__(self.message)
+
+def text_to_image_invoke_model(model_id, body):
+    """
+    Generate an image using Amazon Nova Canvas model on demand.
+    Args:
+        model_id (str): The model ID to use.
+        body (str): The request body to use.
+    Returns:
+        image_bytes (bytes): The image generated by the model.
+    """
+
+    # logger.info("Generating image with Amazon Nova Canvas model", model_id)
+
+    accept = "application/json"
+    content_type = "application/json"
+
+    response = call_with_limits(
+        "bedrock-runtime", model_id, client.invoke_model,
+        body=body, modelId=model_id, accept=accept, contentType=content_type
+    )
+    response_bytes = response.get("body").read()
+    record_bytes("bedrock-runtime", "invoke_model", model_id, received=len(response_bytes))
+    response_body = json.loads(response_bytes)
+
+    base64_image = response_body.get("images")[0]
+    base64_bytes = base64_image.encode('ascii')
+    image_bytes = base64.b64decode(base64_bytes)
+
+    finish_reason = response_body.get("error")
+
+    if finish_reason is not None:
+        raise ImageError(f"Image generation error. Error is {finish_reason}")
+
+    return image_bytes
+
+def create_image(prompt, i, workspace=None):
+    """Generates an image for the prompt, saves it and its variants as generated_image_{i}* in the workspace and returns the ImageAsset. Makes no UI calls."""
+    model_id = 'amazon.nova-canvas-v1:0'
+    body = json.dumps({
+        "taskType": "TEXT_IMAGE",
+        "textToImageParams": {"text": prompt},
+        "imageGenerationConfig": {"numberOfImages": 1, "height": 1024, "width": 1024, "cfgScale": 8.0, "seed": random.randint(0, 2147483646)}
+    })
+
+    with span("image_generation", prompt_chars=len(prompt)) as current:
+        try:
+            # Throttling is retried by the shared rate limiter
+            image_bytes = text_to_image_invoke_model(model_id=model_id, body=body)
+        except Exception as e:
+            if is_throttling(e):
+                print(f"Image generation still throttled after retries: {str(e)}")
+                return None
+
+            # If the error is not throttling-related, fall back to a generic podcast image
+            print(f"Error occurred while generating image: {str(e)}")
+            body = json.dumps({
+                "taskType": "TEXT_IMAGE",
+                "textToImageParams": {"text": "Generate an image for a podcast without any human"},
+                "imageGenerationConfig": {"numberOfImages": 1, "height": 1024, "width": 1024, "cfgScale": 8.0, "seed": 0}
+            })
+            image_bytes = text_to_image_invoke_model(model_id=model_id, body=body)
+            current.set(fallback=True)
+
+    # Decoded once here, downstream stages use the prepared frame and preview
+    return prepare_image_asset(image_bytes, workspace_file(workspace, f"generated_image_{i}.png"))
+
+def polly_audio(text, voice_id, output_format, sample_rate=None):
+    """Returns the Polly audio bytes for a given text, served from the shared cache when possible"""
+    engine = 'generative'
+    language_code = 'en-US'
+
+    # Every line is a "tts" span, cache hits included, so the span count is the number of lines voiced
+    with span("tts", voice=voice_id, chars=len(text), format=output_format) as current:
+        # Serve repeated lines (intro, regenerations, re-runs) from the shared cache without calling Polly
+        tts_cache = get_tts_cache()
+        cache_key = TTSCache.make_key(text, voice_id, engine, language_code, output_format, sample_rate)
+        audio_bytes = tts_cache.get(cache_key)
+        current.set(cached=audio_bytes is not None)
+        if audio_bytes is not None:
+            print(f"Audio for {voice_id} served from cache")
+            return audio_bytes
+
+        request = {
+            'Engine': engine,
+            'LanguageCode': language_code,
+            'Text': text,
+            'TextType': 'text',  # Text input (no SSML tags)
+            'OutputFormat': output_format,
+            'VoiceId': voice_id
+        }
+        if sample_rate:
+            request['SampleRate'] = str(sample_rate)
+
+        response = call_with_limits('polly', None, polly_client.synthesize_speech, **request)
+        audio_bytes = response['AudioStream'].read()
+        record_bytes('polly', 'synthesize_speech', None, received=len(audio_bytes))
+
+        tts_cache.put(cache_key, audio_bytes)
+
+        return audio_bytes
+
+def synthesize_speech(text, voice_id, output_filename):
+    """Synthesizes speech for a given text and saves the result to a file"""
+    audio_bytes = polly_audio(text, voice_id, 'mp3')
+
+    # Write the audio stream to a file
+    with open(output_filename, 'wb') as audio_file:
+        audio_file.write(audio_bytes)
+        print(f"Audio for {voice_id} saved to {output_filename}")
+
+    return output_filename
+
+def synthesize_speech_pcm(text, voice_id, output_filename=None):
+    """Synthesizes speech for a given text and returns it as raw 16-bit mono PCM"""
+    return polly_audio(text, voice_id, 'pcm', pcm_sample_rate)
+
+class SpeechPipeline:
+    """
+    Synthesizes script lines on a bounded thread pool as they are submitted, keeping script order.
+
+    Lines can be submitted all at once or one at a time while the script is still being generated.
+    Results are collected on the calling thread (poll/finish), so callbacks there may update the UI.
+    In "pcm" output mode every line is streamed into a single WAV file instead of one MP3 per line.
+    In "mp3" mode an optional HlsAudioStream receives every file as soon as it is in order.
+    """
+
+    def __init__(self, max_in_flight=None, output_mode=None, workspace=None, stream=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight or polly_max_in_flight)
+        self.output_mode = output_mode or audio_output_mode
+        self.workspace = workspace
+        self.futures = {}  # Future -> request index
+        self.results = []
+        self.labels = []  # Script line indices voiced by each request
+        self.failed_lines = []
+        self.completed = 0
+
+        if self.output_mode == "pcm":
+            self.synthesize = synthesize_speech_pcm
+            self.pcm_filename = workspace_file(workspace, "podcast_pcm.wav")
+            self.writer = OrderedPcmWriter(self.pcm_filename, pcm_sample_rate, gap_ms=pcm_turn_gap_ms)
+        else:
+            self.synthesize = synthesize_speech
+            self.writer = None
+        self.stream = stream if self.output_mode == "mp3" else None
+
+    def submit(self, text, voice_id, output_filename, lines=None):
+        """Queue a request for synthesis and return its index, lines are the script lines it voices"""
+        index = len(self.results)
+        self.results.append(None)
+        self.labels.append(lines or [index])
+        self.futures[self.executor.submit(with_trace(self.synthesize), text, voice_id, output_filename)] = index
+        return index
+
+    def _collect(self, future):
+        index = self.futures.pop(future)
+        try:
+            result = future.result()
+            if self.writer:
+                # The PCM is in the WAV now, don't keep a second copy in memory
+                self.writer.write(index, result)
+            else:
+                self.results[index] = result
+        except Exception as e:
+            print(f"An error occurred while synthesizing line(s) {', '.join(str(line + 1) for line in self.labels[index])}: {e}")
+            self.failed_lines += [(line, e) for line in self.labels[index]]
+        self.completed += 1
+
+        if self.stream and self.results[index]:
+            try:
+                self.stream.add(index, self.results[index])
+            except MediaError as e:
+                # The live stream is a preview, the merged podcast is still produced
+                print(f"Progressive playback stopped: {e}")
+                self.stream = None
+
+        if self.workspace:
+            self.workspace.check_quota()
+
+    def poll(self):
+        """Collect the lines that have already finished, without blocking"""
+        for future in [future for future in self.futures if future.done()]:
+            self._collect(future)
+
+    def finish(self, on_progress=None):
+        """
+        Wait for every submitted line.
+        Args:
+            on_progress (callable): Called as on_progress(completed, total) as lines finish.
+        Returns:
+            audio_files (list): The audio files in script order (a single WAV in PCM mode).
+        """
+        try:
+            for future in as_completed(list(self.futures)):
+                self._collect(future)
+                if on_progress:
+                    on_progress(self.completed, len(self.results))
+        except BaseException:
+            # Don't start the queued lines if the job is being abandoned (e.g. over its disk quota)
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        finally:
+            self.executor.shutdown(wait=True)
+            if self.writer:
+                self.writer.close()
+
+        if self.failed_lines:
+            # Don't leave partial output behind, a merge would silently skip the missing lines
+            partial_files = [self.pcm_filename] if self.writer else self.results
+            for audio_file in partial_files:
+                if audio_file and os.path.exists(audio_file):
+                    os.remove(audio_file)
+
+            self.failed_lines.sort(key=lambda failure: failure[0])
+            line_numbers = ", ".join(str(index + 1) for index, _ in self.failed_lines)
+            raise SpeechError(f"Speech synthesis failed for line(s) {line_numbers}: {self.failed_lines[0][1]}", self.failed_lines)
+
+        return [self.pcm_filename] if self.writer else self.results
+
+    def cancel(self):
+        """Drop every line that hasn't started and wait for the running ones"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        if self.writer:
+            self.writer.close()
+
+def synthesize_lines(speech_requests, max_in_flight=None, on_progress=None, output_mode=None, workspace=None, stream=None):
+    """
+    Synthesize speech for many lines concurrently while keeping script order.
+    Args:
+        speech_requests (list): (text, voice_id, output_filename) or (text, voice_id, output_filename, lines) tuples in script order.
+        max_in_flight (int): Maximum number of concurrent Polly requests.
+        on_progress (callable): Called as on_progress(completed, total) from the calling thread.
+        output_mode (str): "mp3" or "pcm", audio_output_mode by default.
+        workspace (JobWorkspace): The job workspace, used for the PCM file and the disk quota.
+        stream (HlsAudioStream): Optional live stream the MP3 files are published to as they finish.
+    Returns:
+        audio_files (list): The audio files, in script order.
+    """
+    max_in_flight = max_in_flight or polly_max_in_flight
+    if not speech_requests:
+        return []
+
+    pipeline = SpeechPipeline(min(max_in_flight, len(speech_requests)), output_mode, workspace, stream)
+    for speech_request in speech_requests:
+        pipeline.submit(*speech_request)
+
+    return pipeline.finish(on_progress)
+
+def clean_script(script_lines):
+    """Cleans the input script lines to remove unwanted characters or formatting issues."""
+    cleaned_lines = []
+    for line in script_lines:
+        # Remove unwanted characters (like leading/trailing spaces or unexpected symbols)
+        line = line.strip()
+        
+        # Remove '**' or other symbols from speaker names, if present
+        line = line.replace("**", "").strip()  # Remove '**' symbols if they exist
+        
+        if line:
+            cleaned_lines.append(line)
+    return cleaned_lines
+
+# Mapping speakers to their voices
+speaker_map = {
+    "Speaker 1": "Ruth",  # Voice for Speaker 1
+    "Speaker 2": "Stephen",  # Voice for Speaker 2
+    "Host 1": "Ruth",  # Voice for Host 1
+    "Host 2": "Stephen",  # Voice for Host 2
+}
+
+def parse_script_line(line):
+    """Split a cleaned script line into (speaker, voice, text), or None if it isn't dialogue"""
+    # Ensure the line is in the correct format: "Speaker X: Text"
+    if ":" not in line:
+        print(f"Skipping invalid line: {line}")
+        return None
+
+    # Split the line by speaker and text
+    speaker, text = line.split(":", 1)
+
+    # Clean speaker name and text
+    speaker = speaker.strip()  # Remove extra spaces around the speaker label
+    text = text.strip()  # Remove extra spaces around the text
+
+    # Check if the speaker is in the map (supports both "Speaker X" and "Host X")
+    if speaker in speaker_map:
+        voice = speaker_map[speaker]
+    else:
+        # If speaker isn't found, log and default to 'Ruth'
+        print(f"Warning: Speaker '{speaker}' not found. Defaulting to 'Ruth'.")
+        voice = "Ruth"  # Default to 'Ruth' if speaker is unknown
+
+    return speaker, voice, text
+
+def speaks_alone(speaker, intro_seen):
+    """
+    Whether a line is voiced in a Polly request of its own: lines that aren't dialogue (the Title line)
+    and the first dialogue line, the fixed intro, whose request is then the same in every episode and
+    is served from the TTS cache
+    """
+    return speaker not in speaker_map or not intro_seen
+
+def planned_speech_request(planned, workspace=None):
+    """Turn a PlannedRequest into a (text, voice, output_filename, lines) synthesis request"""
+    # Output filename based on speaker and the first line number (and the piece of a split line)
+    suffix = f"_{planned.part + 1}" if planned.parts > 1 else ""
+    output_filename = workspace_file(workspace, f"output_{planned.speaker.replace(' ', '_')}_{planned.lines[0] + 1}{suffix}.mp3")
+    return planned.text, planned.voice_id, output_filename, planned.lines
+
+def plan_script(cleaned_script, workspace=None):
+    """Plan the Polly requests for cleaned script lines (see SpeechPlanner)"""
+    planner = SpeechPlanner()
+    planned = []
+    intro_seen = False
+    for i, line in enumerate(cleaned_script):
+        parsed = parse_script_line(line)
+        if parsed:
+            speaker, voice, text = parsed
+            planned += planner.add(i, speaker, voice, text, alone=speaks_alone(speaker, intro_seen))
+            intro_seen = intro_seen or speaker in speaker_map
+    planned += planner.flush()
+    print(f"Speech plan: {planner.lines_added} lines in {planner.requests_planned} Polly requests")
+    return [planned_speech_request(request, workspace) for request in planned]
+
+def process_script(script_lines, on_progress=None, workspace=None, stream=None):
+    """Process the script and synthesize speech based on the speaker, merging short same-voice lines and splitting long ones"""
+    # Clean the script lines to remove extra spaces, special characters, etc.
+    cleaned_script = clean_script(script_lines)
+
+    # (text, voice, filename, script lines) to synthesize, in script order
+    speech_requests = plan_script(cleaned_script, workspace)
+
+    # Synthesize all requests concurrently, the files come back in script order for merging later
+    audio_files = synthesize_lines(speech_requests, on_progress=on_progress, workspace=workspace, stream=stream)
+    print(f"TTS cache stats: {get_tts_cache().stats()}")
+
+    return audio_files
+
+def get_title(script):
+    # Regular expression to find the title
+    title_pattern = r"Title:\s*(.*)"
+
+    # Search for the title using regex
+    match = re.search(title_pattern, script)
+
+    if match:
+        # Extract the title and clean it
+        title = match.group(1).strip()
+        
+        # Remove any leading/trailing markdown-style formatting
+        title = title.lstrip('**').rstrip('**')
+        
+        # Remove all double quotes
+        title = title.replace('"', '')
+        
+        print(f"Title extracted: {title}")
+    else:
+        title = None
+        print("No title found in the response text.")
+
+    return title
+
+def run_inline(fn, *args, **kwargs):
+    """Default run_cpu: run the work on the calling thread"""
+    return fn(*args, **kwargs)
+
+def merge_audio_files(audio_files, output_filename="final_podcast.mp3", run_cpu=run_inline):
+    """Merge multiple MP3 files into one"""
+    with span("audio_merge", files=len(audio_files)):
+        if all(audio_file.endswith(".wav") for audio_file in audio_files):
+            # PCM mode already assembled the episode, this is its one and only encode
+            run_cpu(encode_mp3, audio_files, output_filename)
+        elif audio_merge_mode == "copy":
+            try:
+                # Join the MP3 frames directly, linear in episode length and without a second encode
+                run_cpu(concat_mp3_stream_copy, audio_files, output_filename)
+            except MediaError as e:
+                print(f"Stream copy merge failed, falling back to re-encoding: {e}")
+                run_cpu(concat_mp3_reencode, audio_files, output_filename)
+        else:
+            run_cpu(concat_mp3_reencode, audio_files, output_filename)
+    print(f"Final podcast saved as {output_filename}")
+
+    # Clean up temporary audio files
+    for audio_file in audio_files:
+        os.remove(audio_file)
+
+    return output_filename
+
+def build_system_prompt(source, url=None):
+    """Build the script instructions for a source ("URL", "Document" or "Existing Script")"""
+    if source == "URL":
+        prompt0 = f"Convert the provided article contents from {url} "
+    elif source == "Document":
+        prompt0 = "Convert the provided document content "
+    else:
+        prompt0 = ""
+    
+    return prompt0 + SCRIPT_PROMPT
+
+def prepare_source_text(source, document_bytes, document_name, url):
+    """
+    Extract and reduce the text a script is written from (see token_budget.prepare_text).
+    Returns:
+        text (str): The text to send instead of the document block, or None to send the document as-is.
+
+    Articles are always sent as their reduced text. Documents are only replaced when the reduced text
+    is at least PREPROCESS_MIN_SAVINGS smaller, otherwise the model gets the original with its layout.
+    """
+    if source == "URL":
+        try:
+            # The article was fetched for the preview already, this is served from the HTTP cache
+            article = extract_article(fetch_url(url).content, url)
+        except FetchError as e:
+            print(f"Unable to fetch {url}, the script will be written from the URL alone: {e}")
+            return None
+        # Every extracted line is a paragraph, so the budget can cut between them
+        prepared = prepare_text([article.replace("\n", "\n\n")])
+        print(f"Script input: {prepared.report()}")
+        return prepared.text or None
+
+    file_extension = os.path.splitext(document_name)[1].lstrip('.').lower()
+    if file_extension not in ("pdf", "docx", "txt"):
+        return None
+
+    # Reuses the page index built for the preview
+    index = open_document(document_bytes, file_extension)
+    index.wait()
+    prepared = prepare_text(index.pages)
+    print(f"Script input: {prepared.report()}")
+    if not prepared.text.strip() or prepared.savings() < PREPROCESS_MIN_SAVINGS:
+        return None  # Not worth losing the layout (or no text layer, e.g. a scanned PDF)
+    return prepared.text
+
+def build_script_messages(source, document_bytes, document_name, system_prompt, user_prompt, source_text=None):
+    """Build the converse messages that ask the model for the podcast script, from source_text when it is given"""
+    # Append any additional user input as a custom prompt
+    if user_prompt:
+        system_prompt += f"\n\nAdditional Prompt: {user_prompt}"
+
+    # Prepare messages depending on whether the source is a URL or document
+    if source_text:
+        label = "Article contents" if source == "URL" else f"Document {os.path.splitext(document_name)[0]}"
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "text": f"{label}:\n\n{source_text}"
+                    },
+                    {
+                        "text": system_prompt
+                    }
+                ]
+            }
+        ]
+    elif source == "URL":
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "text": system_prompt
+                    }
+                ]
+            }
+        ]
+    else:
+        # Extract the document name without the extension and the file extension
+        document_name_without_extension, file_extension = os.path.splitext(document_name)
+        file_extension = file_extension.lstrip('.')
+        
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "document": {
+                            "name": document_name_without_extension,
+                            "format": file_extension,
+                            "source": {
+                                "bytes": document_bytes
+                            }
+                        }
+                    },
+                    {
+                        "text": system_prompt
+                    }
+                ]
+            }
+        ]
+
+    return messages
+
+def large_document_chunks(document_bytes, document_name):
+    """Split a large document into chunks for map-reduce scripting, or return None if it fits in one request"""
+    document_name_without_extension, file_extension = os.path.splitext(document_name)
+    file_extension = file_extension.lstrip('.').lower()
+
+    try:
+        page_count = estimate_pages(document_bytes, file_extension)
+        if page_count <= map_reduce_min_pages:
+            return None
+        chunks = split_document(document_bytes, document_name_without_extension, file_extension)
+    except Exception as e:
+        # Let the single request path handle (and report on) documents we can't split
+        print(f"Unable to split the document, sending it in one request: {e}")
+        return None
+
+    print(f"Large document ({page_count} pages), scripting it in {len(chunks)} chunks")
+    return chunks if len(chunks) > 1 else None
+
+def generate_script(source, document_bytes, document_name, system_prompt, user_prompt, chunks=None, source_text=None):
+    """Generate the podcast script for a URL or document with a single converse call, or map-reduce for large documents"""
+    if chunks:
+        # Script each chunk in parallel and stitch the segments together with a short reduce pass
+        if user_prompt:
+            system_prompt += f"\n\nAdditional Prompt: {user_prompt}"
+        return generate_script_map_reduce(client, modelId, chunks, system_prompt)
+
+    messages = build_script_messages(source, document_bytes, document_name, system_prompt, user_prompt, source_text)
+
+    # Make the API call
+    response = call_with_limits(
+        "bedrock-runtime", modelId, client.converse,
+        modelId=modelId,
+        messages=messages
+    )
+
+    # Return the summarized text
+    return response['output']['message']['content'][0]['text']
+
+def image_prompt(title):
+    """The Nova Canvas prompt for an episode title"""
+    return f"Generate an image for: {title}"[:1024]
+
+def stream_script_and_synthesize(source, document_bytes, document_name, system_prompt, user_prompt, on_progress=None, on_title=None, on_image=None, workspace=None, stream=None, source_text=None):
+    """
+    Generate the script with converse_stream and start the downstream work while tokens are still arriving.
+    Args:
+        on_progress (callable): Called as on_progress(completed, total) as lines finish synthesizing.
+        on_title (callable): Called with the title as soon as the Title line has been generated.
+        on_image (callable): Called with the ImageAsset once the image is ready.
+        stream (HlsAudioStream): Optional live stream the audio is published to as it is synthesized.
+        source_text (str): Reduced document/article text to send instead of the document (see prepare_source_text).
+    Returns:
+        (script, audio_files): The full script text and its audio files in script order.
+
+    Each complete line is handed to speech synthesis as soon as its newline arrives, and the image
+    is generated in the background from the moment the Title line is seen, so LLM, TTS and image
+    work overlap instead of running back to back.
+    """
+    messages = build_script_messages(source, document_bytes, document_name, system_prompt, user_prompt, source_text)
+
+    speech = SpeechPipeline(workspace=workspace, stream=stream)
+    image_executor = ThreadPoolExecutor(max_workers=1)
+    image_future = None
+    image_shown = False
+    title = None
+    script_parts = []
+    pending = ""
+    line_count = 0  # Cleaned lines seen so far, keeps filenames identical to process_script
+    planner = SpeechPlanner()  # Same-voice lines are merged until the voice changes
+    intro_seen = False
+
+    def handle_line(line):
+        nonlocal title, image_future, line_count, intro_seen
+        cleaned = clean_script([line])
+        if not cleaned:
+            return
+
+        if title is None and "Title:" in cleaned[0]:
+            # Start the image as soon as we know what the episode is about
+            title = get_title(cleaned[0])
+            if on_title:
+                on_title(title)
+            image_future = image_executor.submit(with_trace(create_image), image_prompt(title), 0, workspace=workspace)
+
+        parsed = parse_script_line(cleaned[0])
+        if parsed:
+            speaker, voice, text = parsed
+            for planned in planner.add(line_count, speaker, voice, text, alone=speaks_alone(speaker, intro_seen)):
+                speech.submit(*planned_speech_request(planned, workspace))
+            intro_seen = intro_seen or speaker in speaker_map
+        line_count += 1
+
+    try:
+        # Only opening the stream is limited and retried, a stream that breaks halfway fails the episode
+        response = call_with_limits(
+            "bedrock-runtime", modelId, client.converse_stream,
+            modelId=modelId,
+            messages=messages
+        )
+
+        for event in response["stream"]:
+            delta = event.get("contentBlockDelta", {}).get("delta", {}).get("text")
+            if not delta:
+                continue
+
+            script_parts.append(delta)
+            pending += delta
+
+            # Hand off every line that is complete
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                handle_line(line)
+
+            speech.poll()
+            if on_progress and speech.results:
+                on_progress(speech.completed, len(speech.results))
+
+            # Publish the image as soon as it's ready (callbacks stay on this thread)
+            if image_future and not image_shown and image_future.done():
+                image_shown = True
+                if image_future.result() is not None and on_image:
+                    on_image(image_future.result())
+
+        if pending:
+            handle_line(pending)
+        for planned in planner.flush():
+            speech.submit(*planned_speech_request(planned, workspace))
+    except Exception:
+        speech.cancel()
+        image_executor.shutdown(wait=True, cancel_futures=True)
+        raise
+
+    script = "".join(script_parts)
+    # The converse_stream span only covers opening the stream, its tokens are counted here
+    record_bytes("bedrock-runtime", "converse_stream", modelId, received=len(script.encode("utf-8")))
+
+    if image_future is None:
+        # No Title line in the script, generate the image the same way summarize_and_generate_images does
+        title = get_title(script)
+        if on_title:
+            on_title(title)
+        image_future = image_executor.submit(with_trace(create_image), image_prompt(title), 0, workspace=workspace)
+
+    try:
+        audio_files = speech.finish(on_progress)
+    finally:
+        image_executor.shutdown(wait=True)
+
+    if not image_shown and image_future.result() is not None and on_image:
+        on_image(image_future.result())
+
+    print(f"TTS cache stats: {get_tts_cache().stats()}")
+
+    return script, audio_files
+
+def render_video_track(image_paths, script, output_video_path, run_cpu=run_inline):
+    """
+    Render the silent slideshow track before the audio is ready, sized from the script length.
+    Returns:
+        (path, duration): The video-only MP4 and how many seconds it covers.
+
+    The track is planned for the slowest expected speaking rate plus a margin, the mux cuts it to
+    the real audio length later.
+    """
+    estimated_duration = len(script.split()) / min_words_per_second + 30
+    slides = plan_slides(image_paths, estimated_duration)
+    with span("video_encode", mode="track", seconds=round(estimated_duration)):
+        run_cpu(encode_still_track, slides, output_video_path, 1920, 1080)
+    return output_video_path, sum(duration for _, duration in slides)
+
+def generate_video_from_images_and_audio(image_paths, audio_path, output_video_path, run_cpu=run_inline, video_track=None):
+    """Render the episode video from its images and the merged podcast audio, reusing a pre-rendered video_track when it is long enough"""
+    # Get the audio's duration and plan which image is shown for how long
+    audio_duration = probe_duration(audio_path)
+
+    if video_track:
+        track_path, track_duration = video_track
+        if track_duration >= audio_duration:
+            try:
+                with span("video_encode", mode="mux", seconds=round(audio_duration)):
+                    return run_cpu(mux_video_audio, track_path, audio_path, output_video_path)
+            except MediaError as e:
+                print(f"Muxing the pre-rendered track failed, encoding the video again: {e}")
+        else:
+            print(f"Pre-rendered track is {track_duration:.0f}s but the audio is {audio_duration:.0f}s, encoding the video again")
+
+    slides = plan_slides(image_paths, audio_duration)
+
+    # Set the target resolution for full-screen (1920x1080)
+    target_width = 1920
+    target_height = 1080
+
+    if video_encode_mode == "still":
+        try:
+            # Static images only need a handful of frames, encode them directly with ffmpeg
+            with span("video_encode", mode="still", seconds=round(audio_duration)):
+                run_cpu(encode_still_video, slides, audio_path, output_video_path, target_width, target_height)
+            return output_video_path
+        except MediaError as e:
+            print(f"Still-image encode failed, falling back to moviepy: {e}")
+
+    # moviepy composites on one core, render its parts side by side in the CPU workers
+    with span("video_encode", mode="moviepy", seconds=round(audio_duration), segments=video_segments):
+        encode_video_segmented(slides, audio_path, output_video_path, target_width, target_height, segments=video_segments, run_cpu=run_cpu)
+
+    return output_video_path
+
+def episode_content(source, document_bytes, url):
+    """The input an episode is made from, for the episode cache key: the document/script bytes or the article"""
+    if source != "URL":
+        return document_bytes
+    try:
+        # Served from the HTTP cache or revalidated with a conditional GET in most cases
+        return fetch_url(url).content
+    except FetchError as e:
+        print(f"Unable to fetch {url} for the episode cache key, keying on the URL: {e}")
+        return url.encode("utf-8")
+
+def restore_cached_episode(job, workspace, cached):
+    """Publish a cached episode as the job's artifacts, linking its files into the workspace"""
+    job.add_artifact("script", cached["script"])
+    job.add_artifact("title", cached["title"])
+    for name, path in cached["files"].items():
+        job.add_artifact(name, link_or_copy(path, workspace.file(os.path.basename(path))))
+
+def run_episode(job, workspace, source, document_bytes=None, document_name=None, url=None, user_prompt=None, media_option="Audio", force_regenerate=False, progressive=PROGRESSIVE_PLAYBACK):
+    """
+    Run the episode pipeline (script, image, audio and video), writing every file inside the job workspace.
+    Args:
+        job (Job): Receives stage, progress and artifacts (title, image, script, audio, video) as they are produced.
+        workspace (JobWorkspace): The job's private directory.
+        source (str): "URL", "Document" or "Existing Script".
+        document_bytes (bytes): The uploaded document or script.
+        document_name (str): The uploaded file name, including its extension.
+        url (str): The article URL.
+        user_prompt (str): Optional prompt to customize the episode.
+        media_option (str): "Audio" or "Video".
+        force_regenerate (bool): Ignore the episode cache and run every stage again.
+        progressive (bool): Publish the audio as a growing HLS playlist (artifact "stream") while it is synthesized.
+
+    An identical resubmission (same input, prompts, model, media and voices) is served from the
+    episode cache without any stage running. Documents and articles are reduced to a token budget
+    before scripting (see prepare_source_text). The stages form a DAG: the image, speech synthesis and the silent video track run side by side
+    once the script exists, so the episode waits only on script -> speech -> merge -> mux.
+    """
+    podcast_path = workspace.file("final_podcast.mp3")
+    system_prompt = build_system_prompt(source, url)
+
+    episode_cache = get_episode_cache()
+    cache_key = EpisodeCache.make_key(episode_content(source, document_bytes, url), system_prompt, user_prompt, modelId, media_option, speaker_map)
+    if not force_regenerate:
+        cached = episode_cache.get(cache_key)
+        if cached:
+            started = time.monotonic()
+            job.start_stage("cache", "Loading the DocTalk Episode...")
+            restore_cached_episode(job, workspace, cached)
+            job.finish_stage("cache", time.monotonic() - started)
+            print(f"Episode {cache_key[:12]} served from cache")
+            return
+
+    def update_progress(completed, total):
+        job.check_cancelled()
+        job.set_progress(completed, total, f"Synthesized {completed} of {total} lines")
+
+    # Listeners can start the episode as soon as its first lines are synthesized (MP3 mode only)
+    stream = None
+    if progressive and audio_output_mode == "mp3":
+        stream, stream_url = open_stream(workspace)
+        job.add_artifact("stream", stream_url)
+
+    # Large documents are scripted chunk by chunk instead of in one request
+    chunks = large_document_chunks(document_bytes, document_name) if source == "Document" else None
+
+    def publish_image(asset):
+        # The page shows the small preview, the full image is kept for downloads and the cache
+        job.add_artifact("image", asset.source)
+        job.add_artifact("image_preview", asset.preview)
+        return asset
+
+    def preprocess():
+        try:
+            return prepare_source_text(source, document_bytes, document_name, url)
+        except Exception as e:
+            # The original document still works, just with more input tokens
+            print(f"Unable to reduce the script input, sending the original: {e}")
+            return None
+
+    def streamed_script(source_text):
+        # Generate, voice and illustrate the script at the same time
+        images = []
+        summary, audio_files = stream_script_and_synthesize(
+            source, document_bytes, document_name, system_prompt, user_prompt,
+            on_progress=update_progress,
+            on_title=lambda title: job.add_artifact("title", title),
+            on_image=lambda asset: images.append(publish_image(asset)),
+            workspace=workspace,
+            stream=stream,
+            source_text=source_text
+        )
+        if stream:
+            stream.close()
+        job.add_artifact("script", summary)
+        return summary, audio_files, images[0] if images else None
+
+    def script(source_text=None):
+        if source == "Existing Script":
+            summary = document_bytes.decode('utf-8')
+        else:
+            summary = generate_script(source, document_bytes, document_name, system_prompt, user_prompt, chunks, source_text)
+        job.add_artifact("script", summary)
+
+        # Extract and publish the title
+        title = get_title(summary)
+        job.add_artifact("title", title)
+        return summary, title
+
+    def image(title):
+        # The existing script's title is used as the prompt as-is
+        prompt = title if source == "Existing Script" else image_prompt(title)
+        asset = create_image(prompt, 0, workspace=workspace)
+        if asset is None:
+            return None
+        workspace.check_quota()
+        return publish_image(asset)
+
+    def speech(script):
+        # Split the script by lines and generate audio files for each speaker
+        audio_files = process_script(script.strip().split("\n"), on_progress=update_progress, workspace=workspace, stream=stream)
+        if stream:
+            stream.close()
+        return audio_files
+
+    def merge(audio_files):
+        merge_audio_files(audio_files, podcast_path, run_cpu=job.run_cpu)
+        job.add_artifact("audio", podcast_path)
+        workspace.check_quota()
+        return podcast_path
+
+    def video_track(script, image):
+        if image is None:
+            return None
+        try:
+            return render_video_track([image.frame], script, workspace.file("video_track.mp4"), run_cpu=job.run_cpu)
+        except MediaError as e:
+            print(f"Pre-rendering the video track failed, it will be encoded with the audio: {e}")
+            return None
+
+    def video(podcast, image, video_track=None):
+        if image is None:
+            raise ImageError("No artwork to make the video from")
+        video_path = generate_video_from_images_and_audio([image.frame], podcast, workspace.file("random_video.mp4"), run_cpu=job.run_cpu, video_track=video_track)
+        job.add_artifact("video", video_path)
+        return video_path
+
+    pipeline = Pipeline()
+    if source in ("URL", "Document") and not chunks:
+        # Boilerplate-free, budgeted text instead of the raw document (map-reduce chunks are sent as they are)
+        pipeline.add("preprocess", preprocess, outputs=("source_text",), message="Curating the DocTalk Episode...")
+        script_inputs = ("source_text",)
+    else:
+        script_inputs = ()
+
+    if script_streaming and source in ("URL", "Document") and not chunks:
+        pipeline.add("script", streamed_script, inputs=script_inputs, outputs=("script", "audio_files", "image"), message="Curating the DocTalk Episode...")
+    else:
+        pipeline.add("script", script, inputs=script_inputs, outputs=("script", "title"), message="Curating the DocTalk Episode...")
+        pipeline.add("image", image, inputs=("title",), message="Creating the DocTalk artwork...")
+        pipeline.add("speech", speech, inputs=("script",), outputs=("audio_files",), message="Bringing DocTalk to Life...")
+    pipeline.add("merge", merge, inputs=("audio_files",), outputs=("podcast",), message="Mixing the DocTalk Podcast...")
+
+    if media_option == "Video":
+        if video_encode_mode == "still":
+            # The slideshow only needs the image and the script length, not the final audio
+            pipeline.add("video_track", video_track, inputs=("script", "image"), message="Bringing DocTalk’s Vision to Life...")
+            pipeline.add("video", video, inputs=("podcast", "image", "video_track"), message="Bringing DocTalk’s Vision to Life...")
+        else:
+            pipeline.add("video", video, inputs=("podcast", "image"), message="Bringing DocTalk’s Vision to Life...")
+
+    values = pipeline.run(
+        on_start=lambda stage: job.start_stage(stage.name, stage.message),
+        on_finish=lambda stage, seconds: job.finish_stage(stage.name, seconds),
+        check_cancelled=job.check_cancelled
+    )
+
+    # Keep the finished episode for identical resubmissions, unless the artwork failed
+    if values.get("image"):
+        files = {"image": values["image"].source, "image_preview": values["image"].preview, "audio": values["podcast"]}
+        if values.get("video"):
+            files["video"] = values["video"]
+        episode_cache.put(cache_key, get_title(values["script"]), values["script"], files)
+
+    print(f"Critical path: {' -> '.join(pipeline.critical_path())}")
+    print(f"AWS connection stats: {connection_stats()}")
+    print(f"AWS rate limiter stats: {limiter_stats()}")
+    print(f"Image asset cache stats: {get_image_asset_cache().stats()}")
+    print(f"Time by span (count, seconds): {trace_summary(job.job_id)}")
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+# Finished episodes are kept here and reused when the same input is submitted again
+DEFAULT_CACHE_DIR = os.environ.get("EPISODE_CACHE_DIR", "/tmp/doctalk/episode_cache")
+DEFAULT_MAX_BYTES = int(float(os.environ.get("EPISODE_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+
+def link_or_copy(source_path, target_path):
+    """Hard link source_path to target_path (instant, no extra disk), copying across filesystems"""
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+    return target_path
+
+class EpisodeCache:
+    """
+    On-disk cache of finished episodes.
+
+    An entry is a directory named by the hash of everything that shapes the episode, holding a
+    manifest.json (title, script) and the episode files (image, podcast, video). Entries are
+    published with an atomic directory rename and evicted least-recently-used first once the
+    cache grows past max_bytes. Recency is tracked with the manifest's modification time.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(content, system_prompt, user_prompt, model_id, media_option, voices):
+        """
+        Build the cache key of an episode.
+        Args:
+            content (bytes): The document bytes, existing script or fetched article.
+            voices (dict): Speaker label -> Polly voice.
+        """
+        digest = hashlib.sha256(content or b"")
+        settings = [system_prompt, user_prompt or "", model_id, media_option, json.dumps(voices, sort_keys=True)]
+        digest.update("\x1f".join(settings).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """
+        Return the cached episode for key, or None on a miss.
+        Returns:
+            entry (dict): "title", "script" and "files" (name -> path inside the cache).
+        """
+        entry_dir = self._path(key)
+        manifest_path = os.path.join(entry_dir, "manifest.json")
+        try:
+            with open(manifest_path, encoding="utf-8") as manifest_file:
+                entry = json.load(manifest_file)
+            files = {name: os.path.join(entry_dir, file_name) for name, file_name in entry["files"].items()}
+            if not all(os.path.exists(path) for path in files.values()):
+                raise FileNotFoundError(entry_dir)
+            os.utime(manifest_path)  # Mark as recently used
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        entry["files"] = files
+        return entry
+
+    def put(self, key, title, script, files):
+        """
+        Store a finished episode, best effort: a failed write never fails the episode.
+        Args:
+            files (dict): name -> path of the episode files to keep (e.g. "audio", "video", "image").
+        """
+        if self.max_bytes <= 0:
+            return
+
+        tmp_dir = None
+        try:
+            # Build the entry next to its final location, then publish it with one rename
+            tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp_")
+            stored = {}
+            for name, path in files.items():
+                file_name = name + os.path.splitext(path)[1]
+                link_or_copy(path, os.path.join(tmp_dir, file_name))
+                stored[name] = file_name
+            with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as manifest_file:
+                json.dump({"title": title, "script": script, "files": stored}, manifest_file)
+            os.rename(tmp_dir, self._path(key))
+            tmp_dir = None
+        except OSError as e:
+            # Another session may have stored the same episode first, that copy is just as good
+            if not os.path.isdir(self._path(key)):
+                print(f"Unable to write episode cache entry {key}: {e}")
+            return
+        finally:
+            if tmp_dir:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.evict()
+
+    def evict(self):
+        """Remove least-recently-used episodes until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.startswith(".tmp_") or not entry.is_dir():
+                    continue  # Write in progress
+                try:
+                    size = sum(os.path.getsize(os.path.join(entry.path, name)) for name in os.listdir(entry.path))
+                    last_used = os.stat(os.path.join(entry.path, "manifest.json")).st_mtime
+                except OSError:
+                    continue
+                entries.append((last_used, size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+    def stats(self):
+        """Return hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_episode_cache():
+    """Return the process-wide episode cache, shared across Streamlit sessions and batch jobs"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EpisodeCache()
+        return _default_cache
@@ -0,0 +1,280 @@
+import email.utils
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError
+from urllib3.util.retry import Retry
+
+# Timeouts for article downloads, in seconds: (connect, between bytes) and for the whole body
+FETCH_CONNECT_TIMEOUT = float(os.environ.get("FETCH_CONNECT_TIMEOUT", "5"))
+FETCH_READ_TIMEOUT = float(os.environ.get("FETCH_READ_TIMEOUT", "20"))
+FETCH_TOTAL_TIMEOUT = float(os.environ.get("FETCH_TOTAL_TIMEOUT", "60"))
+
+# Pages larger than this are rejected instead of being read into memory
+FETCH_MAX_BYTES = int(float(os.environ.get("FETCH_MAX_MB", "10")) * 1024 * 1024)
+
+# Keep-alive connections kept per host
+FETCH_POOL_CONNECTIONS = int(os.environ.get("FETCH_POOL_CONNECTIONS", "10"))
+
+# On-disk HTTP cache, revalidated with ETag/Last-Modified once an entry is stale
+FETCH_CACHE_DIR = os.environ.get("FETCH_CACHE_DIR", "/tmp/doctalk/http_cache")
+FETCH_CACHE_MAX_BYTES = int(float(os.environ.get("FETCH_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+# Entries without Cache-Control/Expires are served without a request for this long
+FETCH_CACHE_MIN_FRESH_SECONDS = int(os.environ.get("FETCH_CACHE_MIN_FRESH_SECONDS", "300"))
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+max_age_pattern = re.compile(r"max-age=(\d+)")
+
+# Define FetchError exception
+class FetchError(Exception):
+    """Custom exception for article download errors (timeouts, HTTP errors, oversized pages)."""
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+class FetchResponse:
+    """The body of a fetched page and how it was obtained"""
+
+    def __init__(self, url, content, status_code, content_type=None, cache_status=None):
+        self.url = url
+        self.content = content
+        self.status_code = status_code
+        self.content_type = content_type
+        self.cache_status = cache_status  # None (downloaded), "fresh", "revalidated" or "stale"
+
+class HTTPCache:
+    """
+    On-disk cache of fetched pages keyed by URL.
+
+    Each entry is one file: a JSON header line (validators, freshness, content type) followed by the
+    body. Files are written atomically so sessions and processes can share the directory, and the
+    least-recently-used entries are evicted once it grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir=FETCH_CACHE_DIR, max_bytes=FETCH_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, url):
+        """Return (meta, body) for url, or (None, None) on a miss"""
+        path = self._path(url)
+        try:
+            with open(path, "rb") as cached_file:
+                meta = json.loads(cached_file.readline())
+                body = cached_file.read()
+            os.utime(path)  # Mark as recently used
+        except (OSError, ValueError):
+            return None, None
+        return meta, body
+
+    def put(self, url, meta, body):
+        """Store an entry, best effort: a failed write never fails the fetch"""
+        if self.max_bytes <= 0 or len(body) > self.max_bytes:
+            return
+
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(json.dumps(meta).encode("utf-8") + b"\n")
+                tmp_file.write(body)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Unable to write HTTP cache entry for {url}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        self.evict()
+
+    def evict(self):
+        """Remove least-recently-used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith(".tmp"):
+                        continue  # Write in progress
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+
+def freshness_seconds(headers):
+    """How long a response may be served without revalidation, or None if it must not be stored"""
+    cache_control = headers.get("Cache-Control", "").lower()
+    if "no-store" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return 0
+
+    match = max_age_pattern.search(cache_control)
+    if match:
+        return int(match.group(1))
+
+    expires = headers.get("Expires")
+    if expires:
+        try:
+            return max(0, email.utils.parsedate_to_datetime(expires).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return 0  # Invalid dates mean already expired
+    return FETCH_CACHE_MIN_FRESH_SECONDS
+
+_session = None
+_cache = None
+_init_lock = threading.Lock()
+
+def get_session():
+    """Return the shared keep-alive session used for every article download"""
+    global _session
+    with _init_lock:
+        if _session is None:
+            _session = requests.Session()
+            # Connection errors and gateway failures are retried, never read timeouts of a slow site
+            retries = Retry(total=2, connect=2, read=0, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=("GET",), raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=FETCH_POOL_CONNECTIONS, pool_maxsize=FETCH_POOL_CONNECTIONS, max_retries=retries)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers["User-Agent"] = USER_AGENT
+        return _session
+
+def get_http_cache():
+    """Return the process-wide HTTP cache"""
+    global _cache
+    with _init_lock:
+        if _cache is None:
+            _cache = HTTPCache()
+        return _cache
+
+def read_body(response, max_bytes, deadline):
+    """
+    Stream the response body, enforcing the byte cap and the total deadline.
+
+    Each read waits at most until the deadline (the socket's read timeout shrinks as it gets close),
+    so a server that stalls in the middle of a chunk can't hold the download past it.
+    """
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise FetchError(f"The page is {int(content_length) / 1024 / 1024:.1f} MB, over the {max_bytes / 1024 / 1024:.1f} MB limit")
+
+    # urllib3 keeps the socket of a streamed response on its connection, read1 is a single socket read
+    sock = getattr(getattr(response.raw, "_connection", None), "sock", None)
+    read = getattr(response.raw, "read1", response.raw.read)
+
+    chunks = []
+    size = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise FetchError(f"Downloading the page took longer than {FETCH_TOTAL_TIMEOUT:.0f} seconds")
+        if sock is not None:
+            sock.settimeout(min(FETCH_READ_TIMEOUT, remaining))
+
+        try:
+            chunk = read(64 * 1024, decode_content=True)
+        except ReadTimeoutError as e:
+            if time.monotonic() >= deadline:
+                raise FetchError(f"Downloading the page took longer than {FETCH_TOTAL_TIMEOUT:.0f} seconds")
+            raise requests.ReadTimeout(e, response=response)
+        except ProtocolError as e:
+            raise requests.ConnectionError(e, response=response)
+        except DecodeError as e:
+            raise FetchError(f"Unable to decode the page: {e}")
+
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise FetchError(f"The page is over the {max_bytes / 1024 / 1024:.1f} MB limit")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def fetch_url(url, max_bytes=FETCH_MAX_BYTES, use_cache=True):
+    """
+    Download a page through the shared session and HTTP cache.
+    Args:
+        url (str): The page to fetch.
+        max_bytes (int): Larger bodies raise FetchError instead of being read.
+        use_cache (bool): False skips the cache in both directions.
+    Returns:
+        response (FetchResponse): The body, status and cache_status.
+
+    A fresh cache entry is returned without any request, a stale one is revalidated with
+    If-None-Match/If-Modified-Since so an unchanged page costs a 304. If the site can't be reached,
+    times out or fails with a 5xx, a stale entry is served rather than failing. Other errors, such as
+    a 404 or 410, raise FetchError even when the page is cached.
+    """
+    cache = get_http_cache() if use_cache else None
+    meta, body = cache.get(url) if cache else (None, None)
+    now = time.time()
+
+    if meta is not None and now < meta["fresh_until"]:
+        return FetchResponse(url, body, meta["status_code"], meta.get("content_type"), "fresh")
+
+    headers = {}
+    if meta is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    deadline = time.monotonic() + FETCH_TOTAL_TIMEOUT
+    try:
+        with get_session().get(url, headers=headers, stream=True, timeout=(FETCH_CONNECT_TIMEOUT, FETCH_READ_TIMEOUT)) as response:
+            if response.status_code == 304 and meta is not None:
+                # Unchanged, extend the entry's freshness with the new headers
+                fresh_for = freshness_seconds(response.headers)
+                meta["fresh_until"] = now + (fresh_for or 0)
+                cache.put(url, meta, body)
+                return FetchResponse(url, body, meta["status_code"], meta.get("content_type"), "revalidated")
+
+            response.raise_for_status()
+            content = read_body(response, max_bytes, deadline)
+            response_headers = response.headers
+            status_code = response.status_code
+    except requests.RequestException as e:
+        status_code = e.response.status_code if e.response is not None else None
+        unreachable = isinstance(e, (requests.ConnectionError, requests.Timeout)) or (status_code is not None and status_code >= 500)
+        if meta is not None and unreachable:
+            print(f"Fetching {url} failed ({e}), serving the cached copy")
+            return FetchResponse(url, body, meta["status_code"], meta.get("content_type"), "stale")
+        raise FetchError(f"Unable to fetch {url}: {e}")
+
+    fresh_for = freshness_seconds(response_headers)
+    if cache and fresh_for is not None:
+        cache.put(url, {
+            "status_code": status_code,
+            "content_type": response_headers.get("Content-Type"),
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+            "fresh_until": now + fresh_for,
+        }, content)
+
+    return FetchResponse(url, content, status_code, response_headers.get("Content-Type"))
@@ -0,0 +1,167 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from PIL import Image
+from episode_cache import link_or_copy
+from media import letterbox
+
+# Prepared variants of generated images, keyed by the hash of the image bytes
+IMAGE_ASSET_DIR = os.environ.get("IMAGE_ASSET_DIR", "/tmp/doctalk/image_assets")
+IMAGE_ASSET_MAX_BYTES = int(float(os.environ.get("IMAGE_ASSET_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+# Longest side and WebP quality of the preview shown in the page
+IMAGE_PREVIEW_SIZE = int(os.environ.get("IMAGE_PREVIEW_SIZE", "640"))
+IMAGE_PREVIEW_QUALITY = int(os.environ.get("IMAGE_PREVIEW_QUALITY", "80"))
+
+class ImageAsset:
+    """A generated image and its prepared variants"""
+
+    def __init__(self, source, frame, preview):
+        self.source = source  # The image as generated (PNG)
+        self.frame = frame  # Letterboxed to the video resolution, used as-is by the encoders
+        self.preview = preview  # Small WebP for the page
+
+class ImageAssetCache:
+    """
+    On-disk cache of image variants.
+
+    The image is decoded once and every variant is produced from that decode, then stored under the
+    hash of the image bytes (and the frame size), so an image seen again (e.g. the generic fallback
+    artwork) costs no decode at all. A miss writes the variants where the job uses them and then
+    links them into the cache atomically, so evicting least-recently-used files once the cache grows
+    past max_bytes never removes a job's own copy. A max_bytes of 0 disables the cache.
+    """
+
+    def __init__(self, cache_dir=IMAGE_ASSET_DIR, max_bytes=IMAGE_ASSET_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def prepare(self, image_bytes, frame_path, preview_path, width=1920, height=1080):
+        """
+        Write the variants of an image to frame_path and preview_path, from the cache on a hit.
+        Args:
+            image_bytes (bytes): The encoded image.
+            frame_path (str), preview_path (str): Where to put the variants (hard links to the cache on a hit).
+            width (int), height (int): The video frame size.
+        """
+        key = hashlib.sha256(image_bytes).hexdigest()
+        cached_frame = os.path.join(self.cache_dir, f"{key}_{width}x{height}.png")
+        cached_preview = os.path.join(self.cache_dir, f"{key}_preview.webp")
+
+        if self.max_bytes > 0 and os.path.exists(cached_frame) and os.path.exists(cached_preview):
+            try:
+                for cached, path in ((cached_frame, frame_path), (cached_preview, preview_path)):
+                    os.utime(cached)  # Mark as recently used
+                    link_or_copy(cached, path)
+                with self._lock:
+                    self.hits += 1
+                return
+            except FileNotFoundError:
+                pass  # Evicted by another job in the meantime, prepared again below
+
+        with self._lock:
+            self.misses += 1
+
+        # One decode for every variant
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image = image.convert("RGB")
+            frame = letterbox(image, width, height)
+            preview = image.copy()
+            preview.thumbnail((IMAGE_PREVIEW_SIZE, IMAGE_PREVIEW_SIZE), Image.LANCZOS)
+
+        # Written where they are used first, so eviction can never take them away from this job
+        self._write(frame, frame_path, "PNG")
+        self._write(preview, preview_path, "WEBP", quality=IMAGE_PREVIEW_QUALITY)
+        if self.max_bytes <= 0:
+            return  # Cache disabled
+
+        self._publish(frame_path, cached_frame)
+        self._publish(preview_path, cached_preview)
+        self.evict()
+
+    def _write(self, image, path, image_format, **options):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                image.save(tmp_file, image_format, **options)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _publish(self, source_path, path):
+        """Atomically add a prepared file to the cache (best effort, a failure only costs a future miss)"""
+        tmp_path = os.path.join(self.cache_dir, f"{os.path.basename(path)}.{threading.get_ident()}.tmp")
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            link_or_copy(source_path, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Unable to cache image variant {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def evict(self):
+        """Remove least-recently-used files until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".tmp"):
+                    continue  # Write in progress
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+
+    def stats(self):
+        """Return hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_image_asset_cache():
+    """Return the process-wide image asset cache"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ImageAssetCache()
+        return _default_cache
+
+def prepare_image_asset(image_bytes, source_path, width=1920, height=1080):
+    """
+    Save a generated image and its variants next to source_path.
+    Args:
+        image_bytes (bytes): The image as returned by the model, written as-is (no decode/re-encode).
+        source_path (str): Where to save it, the variants get _frame.png and _preview.webp suffixes.
+    Returns:
+        asset (ImageAsset): The three files. The variants are shared with the cache through hard links.
+    """
+    with open(source_path, "wb") as source_file:
+        source_file.write(image_bytes)
+
+    base = os.path.splitext(source_path)[0]
+    asset = ImageAsset(source_path, base + "_frame.png", base + "_preview.webp")
+    get_image_asset_cache().prepare(image_bytes, asset.frame, asset.preview, width, height)
+    return asset
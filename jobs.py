@@ -0,0 +1,242 @@
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from metrics import registry, span
+from workspace import JobWorkspace
+
+# Episodes running at once per process, the rest wait in the queue
+JOB_MAX_CONCURRENT = int(os.environ.get("JOB_MAX_CONCURRENT", "2"))
+
+# Processes for CPU-bound media work (encodes), leaving a core free for the Streamlit server
+JOB_CPU_WORKERS = int(os.environ.get("JOB_CPU_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+# Finished jobs (and their workspaces) are kept this long so the page can show the results
+JOB_RESULT_TTL_SECONDS = int(os.environ.get("JOB_RESULT_TTL_SECONDS", "3600"))
+
+# Define JobCancelled exception
+class JobCancelled(Exception):
+    """Raised inside a job once it has been cancelled."""
+    def __init__(self, message="The job was cancelled"):
+        self.message = message
+        super().__init__(self.message)
+
+class Job:
+    """
+    Status, progress and artifacts of one background episode.
+
+    The job function updates it from worker threads while the UI reads snapshot() on every rerun,
+    so all state goes through the lock.
+    """
+
+    def __init__(self, job_id=None, run_cpu=None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.status = "queued"  # queued, running, succeeded, failed or cancelled
+        self.stage = None
+        self.message = "Waiting for a free worker..."
+        self.progress = None  # (completed, total)
+        self.artifacts = {}
+        self.stage_timings = {}
+        self.active_stages = {}  # Stages of a pipeline that are running right now, name -> message
+        self.error = None
+        self.workspace = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._stage_started = None
+        self._run_cpu = run_cpu
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage, message=None):
+        """Record that the job moved on to a new stage"""
+        now = time.time()
+        with self._lock:
+            if self.stage and self._stage_started:
+                self.stage_timings[self.stage] = self.stage_timings.get(self.stage, 0) + now - self._stage_started
+            self.stage = stage
+            self.message = message or stage
+            self.progress = None
+            self._stage_started = now
+
+    def start_stage(self, stage, message=None):
+        """Record that a pipeline stage started, several stages may be running at once"""
+        with self._lock:
+            self.active_stages[stage] = message or stage
+            self.stage = stage
+            self.message = message or stage
+
+    def finish_stage(self, stage, seconds):
+        """Record that a pipeline stage ended and how long it took"""
+        with self._lock:
+            self.stage_timings[stage] = self.stage_timings.get(stage, 0) + seconds
+            self.active_stages.pop(stage, None)
+            self.progress = None
+            if self.active_stages:
+                # Show the most recently started stage that is still running
+                self.stage, self.message = list(self.active_stages.items())[-1]
+
+    def set_progress(self, completed, total, message=None):
+        """Record progress within the current stage"""
+        with self._lock:
+            self.progress = (completed, total)
+            if message:
+                self.message = message
+
+    def add_artifact(self, name, value):
+        """Publish a (partial) result, e.g. the title as soon as it is known"""
+        with self._lock:
+            self.artifacts[name] = value
+
+    def run_cpu(self, fn, *args, **kwargs):
+        """Run CPU-bound work in the shared process pool (or inline when there is none) and return its result"""
+        if self._run_cpu is None:
+            return fn(*args, **kwargs)
+        return self._run_cpu(fn, *args, **kwargs)
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def check_cancelled(self):
+        """Raise JobCancelled if the job has been cancelled, call between units of work"""
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def done(self):
+        with self._lock:
+            return self.status in ("succeeded", "failed", "cancelled")
+
+    def snapshot(self):
+        """Return a consistent copy of the job state for display"""
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "stage": self.stage,
+                "message": self.message,
+                "progress": self.progress,
+                "artifacts": dict(self.artifacts),
+                "stage_timings": dict(self.stage_timings),
+                "active_stages": list(self.active_stages),
+                "error": self.error,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+            }
+
+    def _finish(self, status, error=None):
+        now = time.time()
+        with self._lock:
+            if self.stage and self._stage_started:
+                self.stage_timings[self.stage] = self.stage_timings.get(self.stage, 0) + now - self._stage_started
+            self.status = status
+            self.error = error
+            self.finished = now
+            self.message = {"succeeded": "Done", "failed": "Failed", "cancelled": "Cancelled"}[status]
+
+class JobRunner:
+    """
+    Runs episode jobs on a bounded thread pool, independent of Streamlit script reruns.
+
+    AWS calls stay on the job's threads, CPU-bound media work is sent to a process pool with
+    run_cpu so encodes can't starve the Streamlit server. Jobs are looked up by id on every rerun.
+    """
+
+    def __init__(self, max_jobs=JOB_MAX_CONCURRENT, cpu_workers=JOB_CPU_WORKERS, result_ttl=JOB_RESULT_TTL_SECONDS):
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="doctalk-job")
+        self.cpu_workers = cpu_workers
+        self.cpu_pool = None
+        self.result_ttl = result_ttl
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def _run_cpu(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.cpu_pool is None:
+                # Spawned (not forked) workers, the parent holds threads and open AWS connections
+                self.cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=multiprocessing.get_context("spawn"))
+            cpu_pool = self.cpu_pool
+        return cpu_pool.submit(fn, *args, **kwargs).result()
+
+    def submit(self, fn, **kwargs):
+        """
+        Queue fn(job, workspace, **kwargs) and return its Job straight away.
+        The workspace is created when the job starts and kept until the job is discarded.
+        """
+        self.reap()
+        job = Job(run_cpu=self._run_cpu)
+        with self._lock:
+            self.jobs[job.job_id] = job
+        self.executor.submit(self._run, job, fn, kwargs)
+        return job
+
+    def _run(self, job, fn, kwargs):
+        if job._cancel_event.is_set():
+            job._finish("cancelled")
+            return
+
+        with job._lock:
+            job.status = "running"
+            job.started = time.time()
+
+        try:
+            job.workspace = JobWorkspace(job_id=job.job_id)
+            # The job id is the trace id, every span of the job (stages, AWS calls, encodes) is filed under it
+            with span("job", trace_id=job.job_id, function=getattr(fn, "__name__", "job")):
+                fn(job, job.workspace, **kwargs)
+            job._finish("succeeded")
+        except JobCancelled:
+            job._finish("cancelled")
+        except Exception as e:
+            traceback.print_exc()
+            job._finish("failed", str(e))
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job:
+            job.cancel()
+
+    def discard(self, job_id):
+        """Cancel the job if it is still going and delete its workspace once it has stopped"""
+        job = self.get(job_id)
+        if job is None:
+            return
+        job.cancel()
+        if job.done():
+            with self._lock:
+                self.jobs.pop(job_id, None)
+            if job.workspace:
+                job.workspace.cleanup()
+
+    def reap(self):
+        """Discard finished jobs older than the result TTL"""
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self.jobs.items() if job.done() and now - job.finished > self.result_ttl]
+        for job_id in expired:
+            self.discard(job_id)
+
+    def queue_depth(self):
+        """Return (running, queued) job counts"""
+        with self._lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return statuses.count("running"), statuses.count("queued")
+
+_default_runner = None
+_default_runner_lock = threading.Lock()
+
+def get_job_runner():
+    """Return the process-wide job runner, shared across Streamlit sessions and reruns"""
+    global _default_runner
+    with _default_runner_lock:
+        if _default_runner is None:
+            _default_runner = JobRunner()
+            registry.gauge("doctalk_jobs", "Episode jobs by state", ("state",), lambda: dict(zip([("running",), ("queued",)], _default_runner.queue_depth())))
+        return _default_runner
@@ -0,0 +1,158 @@
+import io
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from PyPDF2 import PdfReader, PdfWriter
+from document_text import CHARS_PER_PAGE, document_text
+from metrics import with_trace
+from rate_limit import call_with_limits
+
+# Documents with more (estimated) pages than this are scripted chunk by chunk
+MIN_PAGES = int(os.environ.get("MAP_REDUCE_MIN_PAGES", "40"))
+PAGES_PER_CHUNK = int(os.environ.get("MAP_REDUCE_PAGES_PER_CHUNK", "15"))
+MAX_WORKERS = int(os.environ.get("MAP_REDUCE_MAX_WORKERS", "4"))
+
+# Each segment is cut to this length in the reduce prompt, the framing only needs the gist
+SEGMENT_PREVIEW_CHARS = 2000
+
+# Separates the opening from the closing in the reduce output
+SEGMENTS_MARKER = "---SEGMENTS---"
+
+# Lines that are dialogue, with or without markdown around the speaker label
+dialogue_pattern = re.compile(r"^\W*(Speaker|Host) \d")
+
+SEGMENT_INSTRUCTIONS = """
+### This request covers part {part} of {parts} of the document ({label}).
+Write only the conversation for this part. It will be placed between other parts of the same episode, so:
+- Do NOT write a title, the DocTalk welcome line, an introduction or a closing.
+- Start directly with the discussion of this part and cover every page in it.
+- Use only lines that start with **Speaker 1:** or **Speaker 2:**.
+"""
+
+REDUCE_PROMPT = """
+The conversation segments below were written separately for consecutive parts of one document and will be played in order.
+Write only the framing around them, following the instructions further down for the title and introduction:
+1. The line **Title:** followed by a one sentence summary of the whole document.
+2. The opening dialogue: the DocTalk welcome line, the podcast title and a short overview of what is coming.
+3. A line containing exactly {marker}
+4. A short closing dialogue that wraps up the whole episode.
+Use only lines that start with **Speaker 1:** or **Speaker 2:** (apart from the title and the marker line).
+
+{segments}
+
+### Original instructions:
+{system_prompt}
+"""
+
+def estimate_pages(document_bytes, file_extension):
+    """Return the number of pages of a PDF, or an estimate for DOCX/TXT"""
+    if file_extension == "pdf":
+        return len(PdfReader(io.BytesIO(document_bytes)).pages)
+    return max(1, len(extract_text(document_bytes, file_extension)) // CHARS_PER_PAGE)
+
+def extract_text(document_bytes, file_extension):
+    """Extract the plain text of a DOCX or TXT document, from its page index when the preview already built it"""
+    return document_text(document_bytes, file_extension)
+
+def split_document(document_bytes, document_name, file_extension, pages_per_chunk=PAGES_PER_CHUNK):
+    """
+    Split a document into chunks of roughly pages_per_chunk pages.
+    Returns:
+        chunks (list): dicts with a "label" (e.g. "pages 1-15 of 120") and the converse "content" blocks.
+
+    PDFs are split into smaller PDFs, so the model still sees the original layout. DOCX and TXT are
+    split on paragraph boundaries into plain text sections.
+    """
+    chunks = []
+
+    if file_extension == "pdf":
+        reader = PdfReader(io.BytesIO(document_bytes))
+        page_count = len(reader.pages)
+        for start in range(0, page_count, pages_per_chunk):
+            end = min(start + pages_per_chunk, page_count)
+            writer = PdfWriter()
+            for page in reader.pages[start:end]:
+                writer.add_page(page)
+            chunk_bytes = io.BytesIO()
+            writer.write(chunk_bytes)
+
+            chunks.append({
+                "label": f"pages {start + 1}-{end} of {page_count}",
+                "content": [{
+                    "document": {
+                        "name": f"{document_name} part {len(chunks) + 1}",
+                        "format": "pdf",
+                        "source": {"bytes": chunk_bytes.getvalue()}
+                    }
+                }]
+            })
+        return chunks
+
+    # Group whole paragraphs into sections of about pages_per_chunk pages
+    budget = pages_per_chunk * CHARS_PER_PAGE
+    paragraphs = [paragraph for paragraph in re.split(r"\n\s*\n|\n", extract_text(document_bytes, file_extension)) if paragraph.strip()]
+    sections = []
+    current = []
+    current_size = 0
+    for paragraph in paragraphs:
+        if current and current_size + len(paragraph) > budget:
+            sections.append("\n".join(current))
+            current = []
+            current_size = 0
+        current.append(paragraph)
+        current_size += len(paragraph) + 1
+    if current:
+        sections.append("\n".join(current))
+
+    for i, section in enumerate(sections):
+        label = f"section {i + 1} of {len(sections)}"
+        chunks.append({
+            "label": label,
+            "content": [{"text": f"Document {label}:\n\n{section}"}]
+        })
+    return chunks
+
+def converse_text(client, model_id, content):
+    """Send one user message and return the text of the reply"""
+    response = call_with_limits(
+        "bedrock-runtime", model_id, client.converse,
+        modelId=model_id,
+        messages=[{"role": "user", "content": content}]
+    )
+    return response["output"]["message"]["content"][0]["text"]
+
+def generate_script_map_reduce(client, model_id, chunks, system_prompt, max_workers=MAX_WORKERS):
+    """
+    Generate a podcast script for a large document chunk by chunk.
+    Args:
+        client: The bedrock-runtime client.
+        model_id (str): The model to converse with.
+        chunks (list): Output of split_document.
+        system_prompt (str): The full script instructions (including any additional user prompt).
+        max_workers (int): Maximum number of chunk requests in flight.
+    Returns:
+        script (str): Title and opening, then every segment in document order, then the closing.
+
+    The map step writes a segment per chunk in parallel, so wall-clock time follows the slowest chunk.
+    The reduce step only writes the title, opening and closing around the segments.
+    """
+    def generate_segment(part):
+        chunk = chunks[part]
+        prompt = system_prompt + SEGMENT_INSTRUCTIONS.format(part=part + 1, parts=len(chunks), label=chunk["label"])
+        return converse_text(client, model_id, chunk["content"] + [{"text": prompt}])
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        segments = list(executor.map(with_trace(generate_segment), range(len(chunks))))
+
+    # Drop anything that isn't dialogue (stray titles or headings) from the segments
+    segments = ["\n".join(line for line in segment.splitlines() if dialogue_pattern.match(line)) for segment in segments]
+
+    segment_text = "\n\n".join(
+        f"### Segment {i + 1} ({chunk['label']}):\n{segment[:SEGMENT_PREVIEW_CHARS]}"
+        for i, (chunk, segment) in enumerate(zip(chunks, segments))
+    )
+    framing = converse_text(client, model_id, [{"text": REDUCE_PROMPT.format(marker=SEGMENTS_MARKER, segments=segment_text, system_prompt=system_prompt)}])
+
+    opening, _, closing = framing.partition(SEGMENTS_MARKER)
+
+    return "\n".join(part.strip() for part in [opening] + segments + [closing] if part.strip())
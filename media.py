@@ -0,0 +1,514 @@
+import csv
+import math
+import os
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+import wave
+import numpy
+from concurrent.futures import ThreadPoolExecutor
+from pydub import AudioSegment
+from PIL import Image
+from moviepy.editor import ImageClip, AudioFileClip, concatenate_videoclips
+
+# Define MediaError exception
+class MediaError(Exception):
+    """Custom exception for ffmpeg/media processing errors."""
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+def get_ffmpeg_exe():
+    """Return the ffmpeg binary, preferring the system install over the one bundled with imageio-ffmpeg"""
+    ffmpeg_exe = shutil.which("ffmpeg")
+    if ffmpeg_exe:
+        return ffmpeg_exe
+
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception as e:
+        raise MediaError(f"ffmpeg is not available: {e}")
+
+def run_ffmpeg(args):
+    """Run ffmpeg with the given arguments and raise MediaError on failure"""
+    command = [get_ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y"] + args
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise MediaError(f"ffmpeg failed ({result.returncode}): {result.stderr.decode('utf-8', 'replace').strip()}")
+
+def probe_duration(path):
+    """Return the duration of a media file in seconds, as reported by ffmpeg"""
+    command = [get_ffmpeg_exe(), "-hide_banner", "-i", path]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # ffmpeg exits with an error when no output is given, the input info is still printed
+    match = re.search(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr.decode("utf-8", "replace"))
+    if not match:
+        raise MediaError(f"Unable to read the duration of {path}")
+
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def write_concat_list(paths, list_dir, durations=None):
+    """Write an ffmpeg concat demuxer list file for paths (with optional per-entry durations) and return its filename"""
+    fd, list_path = tempfile.mkstemp(dir=list_dir, prefix="concat_", suffix=".txt")
+    with os.fdopen(fd, "w", encoding="utf-8") as list_file:
+        for i, path in enumerate(paths):
+            # Single quotes are escaped as '\'' inside the quoted file name
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+            if durations:
+                list_file.write(f"duration {durations[i]:.3f}\n")
+
+        if durations and paths:
+            # The concat demuxer ignores the duration of the last entry unless it is repeated
+            escaped = os.path.abspath(paths[-1]).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+    return list_path
+
+def concat_mp3_stream_copy(audio_files, output_filename):
+    """
+    Concatenate MP3 files without decoding them.
+    Args:
+        audio_files (list): MP3 files in playback order. They must share codec parameters (all Polly output does).
+        output_filename (str): The merged MP3 file.
+    Returns:
+        output_filename (str): The merged MP3 file.
+
+    The ffmpeg concat demuxer copies MP3 frames straight through, so the cost is linear in episode
+    length, memory stays bounded and there is no generation loss from a second encode.
+    """
+    if not audio_files:
+        raise MediaError("No audio files to merge")
+
+    list_dir = os.path.dirname(os.path.abspath(output_filename))
+    list_path = write_concat_list(audio_files, list_dir)
+    try:
+        run_ffmpeg([
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-map", "0:a", "-c", "copy", "-map_metadata", "-1",
+            output_filename,
+        ])
+    finally:
+        os.remove(list_path)
+
+    return output_filename
+
+def concat_mp3_reencode(audio_files, output_filename):
+    """Decode every MP3 with pydub, append them and re-encode the result (the original merge path)"""
+    if not audio_files:
+        raise MediaError("No audio files to merge")
+
+    # Load the first audio file
+    final_audio = AudioSegment.from_mp3(audio_files[0])
+
+    # Append each subsequent audio file to the final audio
+    for audio_file in audio_files[1:]:
+        audio_segment = AudioSegment.from_mp3(audio_file)
+        final_audio += audio_segment  # Append to the final audio
+
+    # Export the final merged audio file
+    final_audio.export(output_filename, format="mp3")
+
+    return output_filename
+
+def encode_mp3(input_files, output_filename, bitrate="64k"):
+    """Encode one or more audio files (joined in order) into a single MP3 with one encoder pass"""
+    if not input_files:
+        raise MediaError("No audio files to encode")
+
+    list_dir = os.path.dirname(os.path.abspath(output_filename))
+    list_path = write_concat_list(input_files, list_dir)
+    try:
+        run_ffmpeg([
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-map", "0:a", "-c:a", "libmp3lame", "-b:a", bitrate,
+            output_filename,
+        ])
+    finally:
+        os.remove(list_path)
+
+    return output_filename
+
+class OrderedPcmWriter:
+    """
+    Streams raw 16-bit mono PCM chunks into a WAV file in script order.
+
+    Chunks may arrive in any order (lines finish synthesizing out of order). Each one is written as
+    soon as every earlier chunk has been written, so only the out-of-order window is held in memory.
+    Silence between turns is written as zero-filled frames.
+    """
+
+    def __init__(self, output_filename, sample_rate, gap_ms=0):
+        self.output_filename = output_filename
+        self.sample_rate = sample_rate
+        self.gap = b"\x00\x00" * int(sample_rate * gap_ms / 1000)
+        self.next_index = 0
+        self.pending = {}
+        self.frames_written = 0
+        self.wav = wave.open(output_filename, "wb")
+        self.wav.setnchannels(1)
+        self.wav.setsampwidth(2)
+        self.wav.setframerate(sample_rate)
+
+    def write(self, index, pcm_bytes):
+        """Queue the chunk for line index and flush every chunk that is now in order"""
+        self.pending[index] = pcm_bytes
+        while self.next_index in self.pending:
+            chunk = self.pending.pop(self.next_index)
+            if self.next_index > 0 and self.gap:
+                self.wav.writeframesraw(self.gap)
+                self.frames_written += len(self.gap) // 2
+            self.wav.writeframesraw(chunk)
+            self.frames_written += len(chunk) // 2
+            self.next_index += 1
+
+    def duration(self):
+        """Seconds of audio written so far"""
+        return self.frames_written / self.sample_rate
+
+    def close(self):
+        """Finalize the WAV header"""
+        if self.pending:
+            print(f"Warning: {len(self.pending)} PCM chunk(s) were never written, line {self.next_index} is missing")
+        self.wav.close()
+
+class HlsAudioStream:
+    """
+    Publishes MP3 files as a growing HLS audio playlist, so playback can start before the episode is merged.
+
+    Files may arrive in any order. Each one is added as soon as every earlier file has been added:
+    its MP3 frames are stream copied into MPEG-TS segments of about segment_seconds, and the EVENT
+    playlist is rewritten atomically. Every file starts its own timeline, so its first segment is
+    marked as a discontinuity. close() ends the playlist so players treat it as complete.
+    """
+
+    def __init__(self, output_dir, segment_seconds=6):
+        self.output_dir = output_dir
+        self.segment_seconds = segment_seconds
+        self.target_duration = math.ceil(segment_seconds) + 1  # Must not change while the playlist grows
+        self.playlist_path = os.path.join(output_dir, "playlist.m3u8")
+        self.segments = []  # (file name, duration, starts a new file)
+        self.total_duration = 0.0
+        self.pending = {}
+        self.next_index = 0
+        self.closed = False
+        os.makedirs(output_dir, exist_ok=True)
+        self._write_playlist()
+
+    def add(self, index, mp3_path):
+        """Add the index-th file and publish every file that is now in order"""
+        self.pending[index] = mp3_path
+        while self.next_index in self.pending:
+            self._append(self.pending.pop(self.next_index))
+            self.next_index += 1
+
+    def _append(self, mp3_path):
+        start_number = len(self.segments)
+        list_path = os.path.join(self.output_dir, f"segments_{start_number}.csv")
+        run_ffmpeg([
+            "-i", mp3_path, "-map", "0:a", "-c", "copy",
+            "-f", "segment", "-segment_time", str(self.segment_seconds), "-segment_format", "mpegts",
+            "-segment_start_number", str(start_number), "-segment_list", list_path, "-segment_list_type", "csv",
+            os.path.join(self.output_dir, "segment_%05d.ts"),
+        ])
+        try:
+            with open(list_path, newline="") as list_file:
+                for i, (name, start, end) in enumerate(csv.reader(list_file)):
+                    duration = float(end) - float(start)
+                    self.segments.append((name, duration, i == 0))
+                    self.total_duration += duration
+        finally:
+            os.remove(list_path)
+        self._write_playlist()
+
+    def _write_playlist(self):
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{self.target_duration}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for i, (name, duration, new_file) in enumerate(self.segments):
+            if new_file and i > 0:
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines += [f"#EXTINF:{duration:.3f},", name]
+        if self.closed:
+            lines.append("#EXT-X-ENDLIST")
+
+        # Players poll the playlist, never let them read a half-written one
+        fd, tmp_path = tempfile.mkstemp(dir=self.output_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as playlist_file:
+            playlist_file.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.playlist_path)
+
+    def duration(self):
+        """Seconds of audio published so far"""
+        return self.total_duration
+
+    def close(self):
+        """Mark the playlist as complete"""
+        if self.pending:
+            print(f"Warning: {len(self.pending)} file(s) were never published, file {self.next_index} is missing")
+        self.closed = True
+        self._write_playlist()
+
+def plan_slides(image_paths, audio_duration, min_seconds=20, max_seconds=25):
+    """Cycle through image_paths with random 20-25 second durations until the audio is covered"""
+    slides = []
+    total_duration = 0  # Keep track of the total duration of the video
+
+    # Repeat the image sequence until the total duration exceeds the audio duration
+    while total_duration < audio_duration:
+        for image_path in image_paths:
+            duration = random.uniform(min_seconds, max_seconds)
+            slides.append((image_path, duration))
+            total_duration += duration
+
+            # Stop once the total duration exceeds the audio length
+            if total_duration >= audio_duration:
+                break
+
+    return slides
+
+def letterbox(image, width, height):
+    """Scale a PIL image to fit width x height without distortion, padding the rest with black"""
+    image = image.convert("RGB")
+    if image.size == (width, height):
+        return image
+    scale = min(width / image.width, height / image.height)
+    resized = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+
+    frame = Image.new("RGB", (width, height))
+    frame.paste(resized, ((width - resized.width) // 2, (height - resized.height) // 2))
+    return frame
+
+def letterbox_frame(image_path, output_path, width, height):
+    """Letterbox an image file to width x height and save it as output_path"""
+    with Image.open(image_path) as image:
+        letterbox(image, width, height).save(output_path)
+    return output_path
+
+def is_frame_sized(image_path, width, height):
+    """True if the image is already width x height (e.g. a prepared video frame), only the header is read"""
+    with Image.open(image_path) as image:
+        return image.size == (width, height)
+
+def load_frames(image_paths, width, height):
+    """Decode every distinct image once, letterboxed to width x height, as RGB arrays for moviepy"""
+    frames = {}
+    for image_path in image_paths:
+        if image_path not in frames:
+            with Image.open(image_path) as image:
+                frames[image_path] = numpy.asarray(letterbox(image, width, height))
+    return frames
+
+def slide_concat_list(slides, work_dir, width, height):
+    """
+    Letterbox every distinct image of slides once and write the concat list that shows them.
+    Back-to-back repeats of the same image become one longer entry.
+    """
+    frames = {}
+    for image_path, _ in slides:
+        if image_path not in frames:
+            if is_frame_sized(image_path, width, height):
+                frames[image_path] = image_path  # Already prepared, no need to decode it
+            else:
+                frames[image_path] = letterbox_frame(image_path, os.path.join(work_dir, f"frame_{len(frames)}.png"), width, height)
+
+    entries = []
+    for image_path, duration in slides:
+        if entries and entries[-1][0] == frames[image_path]:
+            entries[-1][1] += duration
+        else:
+            entries.append([frames[image_path], duration])
+
+    return write_concat_list([frame for frame, _ in entries], work_dir, [duration for _, duration in entries])
+
+def still_video_args(list_path, fps, audio_path=None):
+    """The x264 arguments for a slideshow read from a concat list, with the audio as a second input if given"""
+    input_args = ["-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_path:
+        # Inputs come before the encoder options, which would otherwise apply to the audio input
+        input_args += ["-i", audio_path, "-map", "0:v", "-map", "1:a"]
+    return input_args + [
+        "-r", str(fps), "-c:v", "libx264", "-tune", "stillimage", "-preset", "veryfast",
+        "-g", str(fps * 10), "-pix_fmt", "yuv420p",
+    ]
+
+def encode_still_video(slides, audio_path, output_video_path, width=1920, height=1080, fps=1):
+    """
+    Encode a still-image or slideshow video with ffmpeg.
+    Args:
+        slides (list): (image_path, duration_seconds) tuples in display order.
+        audio_path (str): The podcast audio to mux in.
+        output_video_path (str): The MP4 to write.
+        width (int), height (int): Target resolution. Each distinct image is letterboxed to it once.
+        fps (int): Output frame rate. Still content needs very few frames.
+    Returns:
+        output_video_path (str): The MP4 file.
+
+    Every distinct image is pre-scaled once, x264 runs with the stillimage tune at a very low frame
+    rate, and the audio is stream copied into the container when the codec allows it.
+    """
+    if not slides:
+        raise MediaError("No images to encode")
+
+    work_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_video_path)), prefix="still_")
+    try:
+        list_path = slide_concat_list(slides, work_dir, width, height)
+        video_args = still_video_args(list_path, fps, audio_path)
+        output_args = ["-shortest", "-movflags", "+faststart", output_video_path]
+
+        try:
+            run_ffmpeg(video_args + ["-c:a", "copy"] + output_args)
+        except MediaError as e:
+            # The container can't take the audio codec as-is, encode it instead
+            print(f"Audio stream copy failed, encoding AAC instead: {e}")
+            run_ffmpeg(video_args + ["-c:a", "aac", "-b:a", "128k"] + output_args)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return output_video_path
+
+def encode_still_track(slides, output_video_path, width=1920, height=1080, fps=1):
+    """
+    Encode only the video stream of a slideshow, so it can be rendered before the audio is final.
+    Returns:
+        output_video_path (str): A video-only MP4, to be combined with mux_video_audio.
+    """
+    if not slides:
+        raise MediaError("No images to encode")
+
+    work_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_video_path)), prefix="still_")
+    try:
+        list_path = slide_concat_list(slides, work_dir, width, height)
+        run_ffmpeg(still_video_args(list_path, fps) + ["-an", output_video_path])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return output_video_path
+
+def mux_video_audio(video_path, audio_path, output_video_path, video_input_args=None):
+    """
+    Combine a video-only track with the audio without re-encoding the video, cut to the audio length.
+    video_input_args replaces ["-i", video_path], e.g. to read the video from a concat list.
+    """
+    video_input_args = video_input_args or ["-i", video_path]
+    mux_args = video_input_args + ["-i", audio_path, "-map", "0:v", "-map", "1:a", "-c:v", "copy"]
+    output_args = ["-shortest", "-movflags", "+faststart", output_video_path]
+
+    try:
+        run_ffmpeg(mux_args + ["-c:a", "copy"] + output_args)
+    except MediaError as e:
+        print(f"Audio stream copy failed, encoding AAC instead: {e}")
+        run_ffmpeg(mux_args + ["-c:a", "aac", "-b:a", "128k"] + output_args)
+
+    return output_video_path
+
+def encode_video_moviepy(slides, audio_path, output_video_path, width=1920, height=1080, fps=24):
+    """Composite and encode the slides with moviepy (the original video path)"""
+    # Load the audio file
+    audio_clip = AudioFileClip(audio_path)
+
+    # Each distinct image is decoded and letterboxed to full screen once, not stretched per slide
+    frames = load_frames([image_path for image_path, _ in slides], width, height)
+    clips = []
+    for image_path, duration in slides:
+        # Load the image as a video clip
+        clips.append(ImageClip(frames[image_path]).set_duration(duration))
+
+    # Concatenate all the image clips into one video
+    video_clip = concatenate_videoclips(clips, method="compose")
+
+    # Set the audio to the video
+    video_clip = video_clip.set_audio(audio_clip)
+
+    # Write the result to a video file
+    video_clip.write_videofile(output_video_path, fps=fps, codec='libx264', audio_codec='aac')
+
+    return output_video_path
+
+def split_slides(slides, parts, fps):
+    """
+    Cut the slideshow timeline into parts of (almost) equal length, on frame boundaries.
+    Returns:
+        segments (list): One list of (image_path, duration_seconds) per part, in order.
+
+    A slide that spans a cut is shown at the end of one part and the start of the next, which looks
+    the same since the images are still.
+    """
+    # Frame ranges of the slides, rounded once on the cumulative time so no frame is lost or doubled
+    ranges = []
+    elapsed = 0.0
+    for image_path, duration in slides:
+        ranges.append((image_path, round(elapsed * fps), round((elapsed + duration) * fps)))
+        elapsed += duration
+
+    total_frames = ranges[-1][2] if ranges else 0
+    bounds = [round(total_frames * k / parts) for k in range(parts + 1)]
+
+    segments = []
+    for start, end in zip(bounds, bounds[1:]):
+        segment = [(image_path, (min(end, last) - max(start, first)) / fps)
+                   for image_path, first, last in ranges if min(end, last) > max(start, first)]
+        if segment:
+            segments.append(segment)
+    return segments
+
+def encode_video_segment(slides, output_video_path, width=1920, height=1080, fps=24):
+    """Composite and encode one part of the slideshow with moviepy, video only (see encode_video_segmented)"""
+    frames = load_frames([image_path for image_path, _ in slides], width, height)
+    clips = [ImageClip(frames[image_path]).set_duration(duration) for image_path, duration in slides]
+    video_clip = concatenate_videoclips(clips, method="compose")
+
+    # Parts run side by side, keep their progress bars out of the log
+    video_clip.write_videofile(output_video_path, fps=fps, codec='libx264', audio=False, logger=None)
+    return output_video_path
+
+def encode_video_segmented(slides, audio_path, output_video_path, width=1920, height=1080, fps=24, segments=1, run_cpu=None, min_segment_seconds=30):
+    """
+    Encode the moviepy slideshow in parallel parts and join them without re-encoding.
+    Args:
+        segments (int): Parts encoded at once, usually the number of CPU workers.
+        run_cpu (callable): Runs run_cpu(fn, *args) and returns its result, e.g. in a process pool.
+            Defaults to the calling thread.
+        min_segment_seconds (float): Shorter videos are cut into fewer parts.
+    Returns:
+        output_video_path (str): The MP4 file.
+
+    moviepy composites on about one core, so the timeline is split into equal parts on frame
+    boundaries (split_slides) and every part is rendered by its own worker. Each part is a separate
+    x264 encode that opens with a keyframe, so the parts join with a concat stream copy and the
+    audio is muxed once at the end.
+    """
+    if not slides:
+        raise MediaError("No images to encode")
+
+    duration = sum(duration for _, duration in slides)
+    parts = max(1, min(segments, int(duration // min_segment_seconds)))
+    run_cpu = run_cpu or (lambda fn, *args: fn(*args))
+    if parts == 1:
+        # Still in a CPU worker, never on the job thread of the server process
+        return run_cpu(encode_video_moviepy, slides, audio_path, output_video_path, width, height, fps)
+
+    work_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_video_path)), prefix="segments_")
+    try:
+        # One thread per part only waits on its worker, the rendering happens in run_cpu
+        with ThreadPoolExecutor(max_workers=parts) as executor:
+            futures = [
+                executor.submit(run_cpu, encode_video_segment, segment, os.path.join(work_dir, f"segment_{i:03d}.mp4"), width, height, fps)
+                for i, segment in enumerate(split_slides(slides, parts, fps))
+            ]
+            segment_paths = [future.result() for future in futures]
+
+        list_path = write_concat_list(segment_paths, work_dir)
+        mux_video_audio(None, audio_path, output_video_path, video_input_args=["-f", "concat", "-safe", "0", "-i", list_path])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return output_video_path
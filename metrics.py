@@ -0,0 +1,327 @@
+import contextvars
+import http.server
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Every metric is kept in process and served as Prometheus text on this port (0 disables the endpoint)
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+
+# Also print CloudWatch Embedded Metric Format lines, the container's log group turns them into metrics
+METRICS_EMF = os.environ.get("METRICS_EMF", "0") == "1"
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "DocTalk")
+
+# Histogram buckets in seconds, from a cached TTS line to a long video encode
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Traces whose per-span totals are kept for trace_summary
+TRACE_MEMORY_ENTRIES = 64
+
+class Counter:
+    """A monotonically increasing value per label combination"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+class Histogram:
+    """Observations counted into cumulative buckets per label combination, like a Prometheus histogram"""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # Labels -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            counts = self.values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, counts in self.values.items():
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", key + (("le", f"{bound:g}"),), count))
+                samples.append((f"{self.name}_bucket", key + (("le", "+Inf"),), counts[-2]))
+                samples.append((f"{self.name}_count", key, counts[-2]))
+                samples.append((f"{self.name}_sum", key, counts[-1]))
+        return samples
+
+class Gauge:
+    """A value read when the metrics are collected: fn returns {labels tuple: value}"""
+
+    def __init__(self, name, help_text, labelnames, fn):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+
+    def samples(self):
+        try:
+            values = self.fn()
+        except Exception as e:
+            print(f"Unable to read gauge {self.name}: {e}")
+            return []
+        return [(self.name, tuple(str(label) for label in key), value) for key, value in values.items()]
+
+class MetricsRegistry:
+    """The metrics of the process, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            # Re-registering returns the existing metric, e.g. when a module is reloaded
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, labelnames, fn):
+        """Register (or replace) a gauge read from fn when the metrics are collected"""
+        with self._lock:
+            self.metrics[name] = Gauge(name, help_text, labelnames, fn)
+            return self.metrics[name]
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self.metrics.values())
+
+        lines = []
+        for metric in metrics:
+            metric_type = {Counter: "counter", Histogram: "histogram", Gauge: "gauge"}[type(metric)]
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric_type}")
+            for name, key, value in metric.samples():
+                labels = list(zip(metric.labelnames, key[:len(metric.labelnames)])) + list(key[len(metric.labelnames):])
+                label_text = ",".join(f'{label}="{escape_label(label_value)}"' for label, label_value in labels)
+                lines.append(f"{name}{{{label_text}}} {value:g}" if label_text else f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+registry = MetricsRegistry()
+
+span_seconds = registry.histogram("doctalk_span_seconds", "Duration of traced pipeline work", ("span", "status"))
+aws_request_seconds = registry.histogram("doctalk_aws_request_seconds", "Latency of each AWS request attempt", ("service", "operation", "model", "outcome"))
+aws_throttles = registry.counter("doctalk_aws_throttles_total", "AWS requests rejected by throttling", ("service", "operation", "model"))
+aws_retries = registry.counter("doctalk_aws_retries_total", "AWS requests retried after a throttle or transient error", ("service", "operation", "model"))
+aws_bytes = registry.counter("doctalk_aws_bytes_total", "Payload bytes sent to and received from AWS", ("service", "operation", "model", "direction"))
+
+def payload_size(value):
+    """Approximate payload bytes of request arguments or a response (strings, bytes, lists and dicts)"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, dict):
+        return sum(payload_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(item) for item in value)
+    return 0  # Streams are counted by the caller once read
+
+def emit_emf(dimensions, metrics, properties=None):
+    """
+    Print one CloudWatch Embedded Metric Format record, when METRICS_EMF is on.
+    Args:
+        dimensions (dict): Dimension name -> value, e.g. {"Service": "polly"}.
+        metrics (dict): Metric name -> (value, unit).
+        properties (dict): Extra searchable fields (trace ids, attributes), not turned into metrics.
+    """
+    if not METRICS_EMF:
+        return
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [list(dimensions)],
+                "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit) in metrics.items()],
+            }],
+        },
+        **(properties or {}),
+        **{name: str(value) for name, value in dimensions.items()},
+        **{name: value for name, (value, _) in metrics.items()},
+    }
+    print(json.dumps(record, default=str), flush=True)
+
+def record_aws_request(service_name, operation, model_id, seconds, outcome):
+    """Record one AWS request attempt, outcome is "ok", "throttled" or "error" """
+    aws_request_seconds.observe(seconds, service=service_name, operation=operation, model=model_id or "", outcome=outcome)
+    if outcome == "throttled":
+        aws_throttles.inc(service=service_name, operation=operation, model=model_id or "")
+
+def record_aws_call(service_name, operation, model_id, seconds, attempts, throttles, bytes_sent, bytes_received):
+    """Record a whole AWS call (every attempt included) and emit it as an EMF record"""
+    if attempts > 1:
+        aws_retries.inc(attempts - 1, service=service_name, operation=operation, model=model_id or "")
+    record_bytes(service_name, operation, model_id, sent=bytes_sent, received=bytes_received)
+    emit_emf(
+        {"Service": service_name, "Operation": operation, "ModelId": model_id or "none"},
+        {"Latency": (seconds, "Seconds"), "Attempts": (attempts, "Count"), "Throttles": (throttles, "Count"), "BytesSent": (bytes_sent, "Bytes")},
+        trace_properties(),
+    )
+
+def record_bytes(service_name, operation, model_id, sent=0, received=0):
+    if sent:
+        aws_bytes.inc(sent, service=service_name, operation=operation, model=model_id or "", direction="sent")
+    if received:
+        aws_bytes.inc(received, service=service_name, operation=operation, model=model_id or "", direction="received")
+
+class Span:
+    """One timed unit of work in a trace"""
+
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.started = time.monotonic()
+        self.seconds = None
+        self.status = "ok"
+
+    def set(self, **attributes):
+        """Add attributes known only once the work is under way, e.g. a cache hit"""
+        self.attributes.update(attributes)
+
+_current_span = contextvars.ContextVar("doctalk_span", default=None)
+_traces = OrderedDict()  # Trace id -> {span name: [count, seconds]}, most recent last
+_traces_lock = threading.Lock()
+
+def current_span():
+    return _current_span.get()
+
+def trace_properties():
+    """The trace/span ids of the calling context, for log records"""
+    current = _current_span.get()
+    return {"TraceId": current.trace_id, "SpanId": current.span_id} if current else {}
+
+@contextmanager
+def span(name, trace_id=None, **attributes):
+    """
+    Time a block of work as a span of the current trace (or a new trace).
+    Args:
+        name (str): What the work is, e.g. "tts" or "stage:merge".
+        trace_id (str): Start a trace with this id instead of joining the current one (e.g. the job id).
+        attributes: Searchable properties of the span, emitted with it.
+
+    Spans nest through contextvars: work on other threads joins the trace when it runs in a copy of
+    the caller's context (contextvars.copy_context().run). Durations go to doctalk_span_seconds,
+    the per-trace totals (see trace_summary) and, with METRICS_EMF, one EMF record per span.
+    """
+    parent = _current_span.get()
+    if trace_id is None:
+        trace_id = parent.trace_id if parent else uuid.uuid4().hex
+    current = Span(name, trace_id, parent.span_id if parent and parent.trace_id == trace_id else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        current.seconds = time.monotonic() - current.started
+        finish_span(current)
+
+def finish_span(current):
+    span_seconds.observe(current.seconds, span=current.name, status="ok" if current.status == "ok" else "error")
+
+    with _traces_lock:
+        totals = _traces.setdefault(current.trace_id, {})
+        _traces.move_to_end(current.trace_id)
+        entry = totals.setdefault(current.name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += current.seconds
+        while len(_traces) > TRACE_MEMORY_ENTRIES:
+            _traces.popitem(last=False)
+
+    emit_emf(
+        {"Span": current.name},
+        {"Duration": (current.seconds, "Seconds")},
+        {"TraceId": current.trace_id, "SpanId": current.span_id, "ParentId": current.parent_id, "Status": current.status,
+         **{name: value for name, value in current.attributes.items() if value is not None}},
+    )
+
+def with_trace(fn):
+    """Wrap fn to run in a copy of the calling context, so work handed to another thread joins the current trace"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+def trace_summary(trace_id):
+    """
+    Where a trace spent its time.
+    Returns:
+        totals (dict): Span name -> (count, seconds), longest first. Spans running side by side overlap.
+    """
+    with _traces_lock:
+        totals = dict(_traces.get(trace_id, {}))
+    return {name: (count, round(seconds, 3)) for name, (count, seconds) in sorted(totals.items(), key=lambda item: -item[1][1])}
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # Scrapes would flood the container log
+
+_server = None
+_server_started = False
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics on port from a background thread, once per process (no-op when port is 0)"""
+    global _server, _server_started
+    with _server_lock:
+        if not _server_started and port:
+            # Tried once, Streamlit reruns the app script on every interaction
+            _server_started = True
+            try:
+                _server = http.server.ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+            except OSError as e:
+                print(f"Unable to serve metrics on port {port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="doctalk-metrics", daemon=True).start()
+            print(f"Metrics served on http://0.0.0.0:{port}/metrics")
+        return _server
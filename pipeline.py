@@ -0,0 +1,126 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from metrics import span, with_trace
+
+# How often the scheduler checks for cancellation while stages are running
+CANCEL_POLL_SECONDS = 0.5
+
+# Define PipelineError exception
+class PipelineError(Exception):
+    """Custom exception for invalid pipelines (missing inputs, cycles, duplicate outputs)."""
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+class Stage:
+    """
+    One step of a pipeline.
+
+    fn is called with the stage's inputs as keyword arguments. A stage with a single output returns
+    its value, a stage with several outputs returns a tuple in the order of outputs.
+    """
+
+    def __init__(self, name, fn, inputs=(), outputs=None, message=None):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs) if outputs is not None else (name,)
+        self.message = message or name
+
+class Pipeline:
+    """
+    A small DAG executor: every stage starts as soon as all of its inputs exist.
+
+    Independent stages (e.g. the image and speech synthesis) run concurrently on a thread pool,
+    so the episode takes as long as its critical path rather than the sum of its stages.
+    Every stage is traced as a "stage:<name>" span of the caller's trace.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.producers = {}
+        self.timings = {}  # name -> (started, finished) in seconds since the run started
+
+    def add(self, name, fn, inputs=(), outputs=None, message=None):
+        """Add a stage and return it"""
+        stage = Stage(name, fn, inputs, outputs, message)
+        for output in stage.outputs:
+            if output in self.producers:
+                raise PipelineError(f"{output} is produced by both {self.producers[output].name} and {name}")
+            self.producers[output] = stage
+        self.stages.append(stage)
+        return stage
+
+    def run(self, values=None, on_start=None, on_finish=None, check_cancelled=None, max_workers=None):
+        """
+        Run every stage and return all values (the initial ones plus every stage output).
+        Args:
+            values (dict): Inputs that are known up front.
+            on_start (callable): Called as on_start(stage) when a stage starts.
+            on_finish (callable): Called as on_finish(stage, seconds) when a stage ends, also on failure.
+            check_cancelled (callable): Raises to cancel the run, called while stages are running.
+            max_workers (int): Stages running at once, all of them by default.
+
+        The first exception (a failed stage or a cancellation) stops new stages from starting, waits for
+        the running ones to return and is raised to the caller.
+        """
+        values = dict(values or {})
+        for stage in self.stages:
+            for name in stage.inputs:
+                if name not in values and name not in self.producers:
+                    raise PipelineError(f"Input {name} of stage {stage.name} is never produced")
+
+        pending = list(self.stages)
+        running = {}
+        started = time.monotonic()
+        self.timings = {}
+
+        def run_stage(stage):
+            stage_started = time.monotonic()
+            if on_start:
+                on_start(stage)
+            try:
+                with span(f"stage:{stage.name}"):
+                    return stage.fn(**{name: values[name] for name in stage.inputs})
+            finally:
+                stage_finished = time.monotonic()
+                self.timings[stage.name] = (stage_started - started, stage_finished - started)
+                if on_finish:
+                    on_finish(stage, stage_finished - stage_started)
+
+        executor = ThreadPoolExecutor(max_workers=max_workers or len(self.stages) or 1, thread_name_prefix="doctalk-stage")
+        try:
+            while pending or running:
+                if check_cancelled:
+                    check_cancelled()
+
+                # Start every stage whose inputs are all available
+                for stage in [stage for stage in pending if all(name in values for name in stage.inputs)]:
+                    pending.remove(stage)
+                    running[executor.submit(with_trace(run_stage), stage)] = stage
+
+                if not running:
+                    raise PipelineError(f"Stages {[stage.name for stage in pending]} wait on each other")
+
+                done, _ = wait(running, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    result = future.result()
+                    if len(stage.outputs) == 1:
+                        result = (result,)
+                    values.update(zip(stage.outputs, result))
+        finally:
+            # Stages that already started are allowed to finish, nothing new is started
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        return values
+
+    def critical_path(self):
+        """Return the stage names of the longest dependency chain of the last run, in order"""
+        path = []
+        stage = max((stage for stage in self.stages if stage.name in self.timings), key=lambda stage: self.timings[stage.name][1], default=None)
+        while stage is not None:
+            path.append(stage.name)
+            parents = [self.producers[name] for name in stage.inputs if name in self.producers and self.producers[name].name in self.timings]
+            stage = max(parents, key=lambda parent: self.timings[parent.name][1], default=None)
+        return path[::-1]
@@ -0,0 +1,60 @@
+import json
+import os
+from media import HlsAudioStream
+from workspace import cleanup_stale_workspaces, register_job_root
+
+# Stream the podcast to the page while it is still being synthesized (needs server.enableStaticServing).
+# Off by default: it writes every job's playlist into static/hls/ and needs the vendored hls.js below
+PROGRESSIVE_PLAYBACK = os.environ.get("PROGRESSIVE_PLAYBACK", "0") == "1"
+
+# Length of the HLS segments, shorter segments start playing sooner but mean more requests
+HLS_SEGMENT_SECONDS = float(os.environ.get("HLS_SEGMENT_SECONDS", "6"))
+
+# Streamlit serves <app directory>/static/ at app/static/, the playlists live under static/hls/
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+HLS_ROOT = os.path.join(STATIC_DIR, "hls")
+
+# hls.js is served from our own static directory, never from a CDN at page load.
+# The Docker build downloads a pinned, checksum-verified release into static/vendor/ (see the Dockerfile)
+HLS_JS_PATH = os.path.join(STATIC_DIR, "vendor", "hls.min.js")
+HLS_JS_URL = "app/static/vendor/hls.min.js"
+
+# Leftover job_* stream directories are removed with the stale workspaces, even when no new stream is opened
+register_job_root(HLS_ROOT)
+
+def open_stream(workspace):
+    """
+    Create the job's HLS audio stream in the static directory.
+    Returns:
+        (stream, url): The HlsAudioStream and the playlist URL, relative to the app's base URL.
+
+    The stream directory is attached to the workspace, so it counts towards the job's quota and is
+    deleted with it. Directories left behind by a crashed process are removed like stale workspaces.
+    """
+    os.makedirs(HLS_ROOT, exist_ok=True)
+    cleanup_stale_workspaces(HLS_ROOT)
+    if not os.path.exists(HLS_JS_PATH):
+        print(f"{HLS_JS_PATH} is missing, live playback only works in browsers with native HLS (Safari)")
+    name = f"job_{workspace.job_id}"
+    stream = HlsAudioStream(workspace.attach_dir(os.path.join(HLS_ROOT, name)), HLS_SEGMENT_SECONDS)
+    return stream, f"app/static/hls/{name}/playlist.m3u8"
+
+def player_html(url):
+    """An audio player for a growing HLS playlist: hls.js where Media Source Extensions exist, native HLS (Safari) otherwise"""
+    return f"""
+<audio id="player" controls style="width: 100%"></audio>
+<!-- Relative to the app's base URL like the playlist, the component's srcdoc frame inherits it -->
+<script src="{HLS_JS_URL}"></script>
+<script>
+  const audio = document.getElementById("player");
+  const src = new URL({json.dumps(url)}, document.baseURI).href;
+  if (window.Hls && Hls.isSupported()) {{
+    // The playlist is an EVENT playlist: play it from the start, not from the live edge
+    const hls = new Hls({{ startPosition: 0 }});
+    hls.loadSource(src);
+    hls.attachMedia(audio);
+  }} else if (audio.canPlayType("application/vnd.apple.mpegurl")) {{
+    audio.src = src;
+  }}
+</script>
+"""
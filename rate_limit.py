@@ -0,0 +1,223 @@
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from metrics import payload_size, record_aws_call, record_aws_request, registry, span
+from botocore.exceptions import ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError
+
+# Requests per second and requests in flight, per service and per "service:model_id".
+# Override with RATE_LIMITS='{"polly": {"tps": 10, "concurrency": 20}}'
+DEFAULT_LIMITS = {
+    "polly": {"tps": 8, "concurrency": 16},
+    "bedrock-runtime": {"tps": 2, "concurrency": 8},  # Applies to each model id separately
+    "bedrock-runtime:amazon.nova-canvas-v1:0": {"tps": 0.5, "concurrency": 2},
+}
+LIMITS = {**DEFAULT_LIMITS, **json.loads(os.environ.get("RATE_LIMITS", "{}"))}
+
+# Services without limits of their own
+FALLBACK_LIMITS = {"tps": 5, "concurrency": 10}
+
+# Unified retry policy: exponential backoff with full jitter
+RETRY_MAX_ATTEMPTS = int(os.environ.get("AWS_RETRY_MAX_ATTEMPTS", "6"))
+RETRY_BASE_DELAY = float(os.environ.get("AWS_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.environ.get("AWS_RETRY_MAX_DELAY", "20"))
+
+THROTTLING_CODES = {
+    "Throttling", "ThrottlingException", "ThrottledException", "TooManyRequestsException",
+    "RequestLimitExceeded", "ProvisionedThroughputExceededException",
+}
+TRANSIENT_CODES = {
+    "ServiceUnavailableException", "ServiceUnavailable", "InternalServerException", "InternalFailure",
+    "ServiceFailureException", "ModelNotReadyException", "RequestTimeout", "RequestTimeoutException",
+}
+TRANSIENT_ERRORS = (ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError)
+
+class RateLimiter:
+    """
+    Token bucket plus concurrency cap shared by every session of the process.
+
+    The refill rate adapts to throttling (AIMD): each throttle cuts it by 30%, each success adds back
+    5% of the configured rate. Aggregate throughput settles just under the service quota instead of
+    every session backing off and retrying in lockstep.
+    """
+
+    def __init__(self, name, tps, concurrency, burst=None):
+        self.name = name
+        self.max_rate = float(tps)
+        self.rate = float(tps)
+        self.capacity = float(burst or max(1.0, tps))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.requests = 0
+        self.throttles = 0
+        self.wait_seconds = 0.0
+        self.in_flight = 0
+        self.waiting = 0  # Callers queued for a slot or a token
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def _take_token(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    @contextmanager
+    def slot(self):
+        """Wait for a concurrency slot and a token, and hold the slot for the duration of the call"""
+        started = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        self._slots.acquire()
+        try:
+            self._take_token()
+            with self._lock:
+                self.waiting -= 1
+                self.requests += 1
+                self.in_flight += 1
+                self.wait_seconds += time.monotonic() - started
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttles += 1
+            self.rate = max(self.max_rate * 0.1, self.rate * 0.7)
+            self.tokens = min(self.tokens, 0.0)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "throttles": self.throttles,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "rate": round(self.rate, 3),
+                "max_rate": self.max_rate,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def valid_limits(limits):
+    """Whether limits has a positive tps and concurrency (a tps of 0 would never grant a token)"""
+    try:
+        return float(limits["tps"]) > 0 and int(limits["concurrency"]) > 0
+    except (KeyError, TypeError, ValueError):
+        return False
+
+def limits_for(key, service_name):
+    """Return the limits of a limiter key, falling back to the defaults when RATE_LIMITS sets invalid ones"""
+    limits = LIMITS.get(key) or LIMITS.get(service_name) or FALLBACK_LIMITS
+    if valid_limits(limits):
+        return limits
+    default = DEFAULT_LIMITS.get(key) or DEFAULT_LIMITS.get(service_name) or FALLBACK_LIMITS
+    print(f"Invalid rate limits for {key} ({limits}), tps and concurrency must be positive. Using {default}")
+    return default
+
+def get_limiter(service_name, model_id=None):
+    """Return the process-wide limiter for a service, or for one model of a service"""
+    key = f"{service_name}:{model_id}" if model_id else service_name
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limits = limits_for(key, service_name)
+            limiter = RateLimiter(key, limits["tps"], limits["concurrency"], limits.get("burst"))
+            _limiters[key] = limiter
+        return limiter
+
+def limiter_stats():
+    """Return the stats of every limiter created so far"""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {key: limiter.stats() for key, limiter in limiters.items()}
+
+def error_code(error):
+    """Return the AWS error code of a ClientError, or None"""
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code")
+    return None
+
+def is_throttling(error):
+    if error_code(error) in THROTTLING_CODES:
+        return True
+    if isinstance(error, ClientError):
+        return error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 429
+    return False
+
+def is_transient(error):
+    if isinstance(error, TRANSIENT_ERRORS) or error_code(error) in TRANSIENT_CODES:
+        return True
+    if isinstance(error, ClientError):
+        return error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") in (500, 502, 503, 504)
+    return False
+
+def call_with_limits(service_name, model_id, fn, *args, **kwargs):
+    """
+    Call fn(*args, **kwargs) through the shared limiter of service_name/model_id.
+    Throttling and transient errors are retried with exponential backoff and full jitter,
+    anything else (and the last failed attempt) is raised to the caller.
+
+    The call is traced as a "<service>.<operation>" span, every attempt's latency is recorded per
+    operation and model, and retries, throttles and payload bytes are counted (see metrics). Streamed
+    responses are counted by the caller with record_bytes once read.
+    """
+    limiter = get_limiter(service_name, model_id)
+    operation = getattr(fn, "__name__", "call")
+    bytes_sent = payload_size(kwargs)
+    started = time.monotonic()
+    throttles = 0
+    with span(f"{service_name}.{operation}", model=model_id) as current:
+        for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+            attempt_started = None
+            try:
+                with limiter.slot():
+                    attempt_started = time.monotonic()
+                    result = fn(*args, **kwargs)
+                record_aws_request(service_name, operation, model_id, time.monotonic() - attempt_started, "ok")
+                limiter.on_success()
+                current.set(attempts=attempt, throttles=throttles)
+                record_aws_call(service_name, operation, model_id, time.monotonic() - started, attempt, throttles, bytes_sent, payload_size(result))
+                return result
+            except Exception as e:
+                throttled = is_throttling(e)
+                if attempt_started is not None:
+                    record_aws_request(service_name, operation, model_id, time.monotonic() - attempt_started, "throttled" if throttled else "error")
+                if throttled:
+                    throttles += 1
+                    limiter.on_throttle()
+
+                if not (throttled or is_transient(e)) or attempt == RETRY_MAX_ATTEMPTS:
+                    current.set(attempts=attempt, throttles=throttles)
+                    record_aws_call(service_name, operation, model_id, time.monotonic() - started, attempt, throttles, bytes_sent, 0)
+                    raise
+
+                # The slot is released while waiting, so other callers keep the quota busy
+                wait_time = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+                print(f"{limiter.name} {'throttled' if throttled else 'failed'} ({e}). Retrying in {wait_time:.2f} seconds (attempt {attempt}/{RETRY_MAX_ATTEMPTS})...")
+                time.sleep(wait_time)
+
+def limiter_gauge(field):
+    """Gauge callback reading one stats field of every limiter"""
+    return lambda: {(key,): stats[field] for key, stats in limiter_stats().items()}
+
+# Requests queued at and running through each limiter, and its adapted rate
+registry.gauge("doctalk_aws_waiting", "AWS requests waiting for a limiter slot or token", ("limiter",), limiter_gauge("waiting"))
+registry.gauge("doctalk_aws_in_flight", "AWS requests in flight", ("limiter",), limiter_gauge("in_flight"))
+registry.gauge("doctalk_aws_rate", "Current requests per second allowed by the adaptive limiter", ("limiter",), limiter_gauge("rate"))
@@ -0,0 +1,111 @@
+import os
+import re
+
+# Polly's per-request text limit for the generative engine, in characters
+POLLY_MAX_CHARS = int(os.environ.get("POLLY_MAX_CHARS", "3000"))
+
+# Adjacent lines spoken by the same voice are merged into requests of up to this many characters
+POLLY_TARGET_CHARS = int(os.environ.get("POLLY_TARGET_CHARS", "1500"))
+
+sentence_boundary = re.compile(r"(?<=[.!?…])\s+")
+clause_boundary = re.compile(r"(?<=[,;:])\s+")
+terminal_punctuation = re.compile(r"[.!?…][\"')\]]*$")
+
+class PlannedRequest:
+    """One Polly request and the script lines it voices"""
+
+    def __init__(self, text, voice_id, speaker, lines, part=0, parts=1):
+        self.text = text
+        self.voice_id = voice_id
+        self.speaker = speaker  # Speaker of the first line
+        self.lines = lines  # Indices of the cleaned script lines, in order
+        self.part = part  # Position of this piece when one line had to be split
+        self.parts = parts
+
+def pack(pieces, max_chars, separator=" "):
+    """Greedily join consecutive pieces into chunks of at most max_chars"""
+    chunks = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + len(separator) + len(piece) <= max_chars:
+            chunks[-1] += separator + piece
+        else:
+            chunks.append(piece)
+    return chunks
+
+def split_text(text, max_chars=POLLY_MAX_CHARS):
+    """
+    Split text into pieces of at most max_chars, on sentence boundaries where possible.
+    Sentences that are still too long are split on clauses, then on words, and cut as a last resort.
+    """
+    if len(text) <= max_chars:
+        return [text]
+
+    pieces = []
+    for sentence in sentence_boundary.split(text.strip()):
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in clause_boundary.split(sentence):
+            if len(clause) <= max_chars:
+                pieces.append(clause)
+                continue
+            for chunk in pack(clause.split(), max_chars):
+                pieces += [chunk[start:start + max_chars] for start in range(0, len(chunk), max_chars)]
+    return pack(pieces, max_chars)
+
+class SpeechPlanner:
+    """
+    Turns parsed script lines into well-sized Polly requests.
+
+    Adjacent lines with the same voice are merged up to target_chars, so short same-speaker
+    fragments cost one round-trip, and lines over max_chars are split on sentence boundaries so
+    Polly never rejects them. Every request keeps the script lines it covers, in order, so the
+    audio still lines up with the script. Lines can be added one at a time (while the script is
+    streaming): add returns the requests that are complete, flush returns the rest. Lines added
+    with alone=True are never merged, e.g. a fixed intro whose request must stay cacheable.
+    """
+
+    def __init__(self, target_chars=POLLY_TARGET_CHARS, max_chars=POLLY_MAX_CHARS):
+        self.target_chars = min(target_chars, max_chars)
+        self.max_chars = max_chars
+        self.pending = None
+        self.lines_added = 0
+        self.requests_planned = 0
+
+    def add(self, line_index, speaker, voice_id, text, alone=False):
+        """Add a script line and return the requests that can be synthesized now (alone: in a request of its own)"""
+        self.lines_added += 1
+        ready = []
+        if not text:
+            return ready  # Nothing to say
+
+        if alone or len(text) > self.max_chars:
+            ready += self.flush()
+            pieces = split_text(text, self.max_chars)
+            ready += [PlannedRequest(piece, voice_id, speaker, [line_index], part, len(pieces)) for part, piece in enumerate(pieces)]
+            self.requests_planned += len(pieces)
+            return ready
+
+        if self.pending is not None:
+            joined = self.pending.text
+            if not terminal_punctuation.search(joined):
+                joined += "."  # Keep the pause between the merged lines
+            joined += " " + text
+            if self.pending.voice_id == voice_id and len(joined) <= self.target_chars:
+                self.pending.text = joined
+                self.pending.lines.append(line_index)
+                return ready
+            ready += self.flush()
+
+        self.pending = PlannedRequest(text, voice_id, speaker, [line_index])
+        return ready
+
+    def flush(self):
+        """Return the request still being built, if any"""
+        if self.pending is None:
+            return []
+        request, self.pending = self.pending, None
+        self.requests_planned += 1
+        return [request]
@@ -0,0 +1,155 @@
+import math
+import os
+import re
+from collections import Counter
+
+# Most input tokens sent with a script request, longer texts are cut at a paragraph boundary
+INPUT_TOKEN_BUDGET = int(os.environ.get("INPUT_TOKEN_BUDGET", "32000"))
+
+# The cleaned text replaces the original document block when it is at least this much smaller
+PREPROCESS_MIN_SAVINGS = float(os.environ.get("PREPROCESS_MIN_SAVINGS", "0.2"))
+
+# Rough size of a token in English text, good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+# Headers and footers are looked for in this many lines at the top and bottom of every page
+EDGE_LINES = 3
+
+page_number_pattern = re.compile(r"^(page\s*)?[-–]?\s*\d+\s*[-–]?(\s*(of|/)\s*\d+)?$", re.IGNORECASE)
+# "Introduction ........ 3": the possessive dot leader must follow a title character, so long dotted lines match in linear time
+toc_entry_pattern = re.compile(r"^.+?[^.\s](?:\s*+\.){3,}+\s*+\d+$")
+toc_heading_pattern = re.compile(r"^(table of )?contents$", re.IGNORECASE)
+# Trailing sections that carry little for a conversation about the document
+low_value_heading_pattern = re.compile(r"^([\dIVX]+\.?\s+)?(references|bibliography|works cited|literature cited|index|acknowledge?ments)$", re.IGNORECASE)
+digits_pattern = re.compile(r"\d+")
+spaces_pattern = re.compile(r"[ \t ]+")
+
+class PreparedText:
+    """Text reduced for a script request, with its token estimates"""
+
+    def __init__(self, text, original_tokens, removed):
+        self.text = text
+        self.original_tokens = original_tokens
+        self.tokens = estimate_tokens(text)
+        self.removed = removed  # What was dropped -> number of lines (or pages cut by the budget)
+
+    def savings(self):
+        """Fraction of the estimated tokens removed"""
+        return 1 - self.tokens / self.original_tokens if self.original_tokens else 0.0
+
+    def report(self):
+        removed = ", ".join(f"{count} {name}" for name, count in self.removed.items() if count)
+        return f"~{self.original_tokens} -> ~{self.tokens} input tokens ({self.savings():.0%} smaller{': ' + removed if removed else ''})"
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def normalize_line(line):
+    """Collapse whitespace inside a line"""
+    return spaces_pattern.sub(" ", line).strip()
+
+def edge_signature(line):
+    """Key under which a header/footer line repeats across pages (page numbers vary, so digits don't count)"""
+    return digits_pattern.sub("#", line.lower())
+
+def edge_positions(lines):
+    """
+    The non-blank lines at the edges of a page.
+    Returns:
+        edges (set): (position, index, line) tuples. position counts non-blank lines from the top (0, 1, ...)
+            or the bottom (-1, -2, ...), index is the line's index in lines.
+    """
+    content = [(index, line) for index, line in enumerate(lines) if line]
+    top = [(position, index, line) for position, (index, line) in enumerate(content[:EDGE_LINES])]
+    bottom_lines = content[-EDGE_LINES:]
+    bottom = [(position - len(bottom_lines), index, line) for position, (index, line) in enumerate(bottom_lines)]
+    return set(top + bottom)
+
+def repeated_edge_lines(pages, min_share=0.5, min_pages=3):
+    """(position, signature) of the lines repeated at the same edge position of at least min_share of the pages"""
+    if len(pages) < min_pages:
+        return set()
+
+    counts = Counter()
+    for lines in pages:
+        counts.update({(position, edge_signature(line)) for position, _, line in edge_positions(lines)})
+    return {key for key, count in counts.items() if count >= max(min_pages, min_share * len(pages))}
+
+def clean_pages(pages):
+    """
+    Strip boilerplate from page texts.
+    Returns:
+        (lines, removed): The remaining lines in order (blank lines separate paragraphs) and what was dropped.
+
+    Lines repeated at the edges of most pages (running headers and footers), page numbers, table of
+    contents entries and trailing reference/bibliography/index sections are removed, and whitespace
+    is collapsed.
+    """
+    removed = Counter()
+    pages = [[normalize_line(line) for line in page.split("\n")] for page in pages]
+    boilerplate = repeated_edge_lines(pages)
+
+    lines = []
+    for page in pages:
+        # Only the repeated lines at the edge positions, the same text in the body is kept
+        edges = {index for position, index, line in edge_positions(page) if (position, edge_signature(line)) in boilerplate}
+        for index, line in enumerate(page):
+            if not line:
+                if lines and lines[-1]:
+                    lines.append("")  # One blank line between paragraphs
+                continue
+            if index in edges:
+                removed["header/footer lines"] += 1
+            elif page_number_pattern.match(line):
+                removed["page numbers"] += 1
+            elif toc_heading_pattern.match(line) or toc_entry_pattern.match(line):
+                removed["table of contents lines"] += 1
+            else:
+                lines.append(line)
+
+        if lines and lines[-1]:
+            lines.append("")
+
+    # Reference-like sections are only dropped in the second half, a heading early on is more likely the topic
+    for i in range(len(lines) // 2, len(lines)):
+        if low_value_heading_pattern.match(lines[i]):
+            removed["reference/index lines"] += sum(1 for line in lines[i:] if line)
+            lines = lines[:i]
+            break
+
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines, removed
+
+def apply_budget(lines, max_tokens):
+    """Keep whole paragraphs while they fit in max_tokens, returns (text, dropped paragraph count)"""
+    paragraphs = "\n".join(lines).split("\n\n")
+    kept = []
+    used = 0
+    for paragraph in paragraphs:
+        tokens = estimate_tokens(paragraph) + 1
+        if used + tokens > max_tokens and kept:
+            break
+        kept.append(paragraph)
+        used += tokens
+
+    dropped = len(paragraphs) - len(kept)
+    text = "\n\n".join(kept)
+    if dropped:
+        text += f"\n\n[The remaining {dropped} paragraphs were left out to fit the input budget.]"
+    return text, dropped
+
+def prepare_text(pages, max_tokens=INPUT_TOKEN_BUDGET):
+    """
+    Reduce page texts (or the paragraphs of an article) for a script request.
+    Args:
+        pages (list): The text of every page, in order.
+        max_tokens (int): Token budget of the result.
+    Returns:
+        prepared (PreparedText): The reduced text and the before/after token estimates.
+    """
+    original_tokens = estimate_tokens("\n".join(pages))
+    lines, removed = clean_pages(pages)
+    text, dropped = apply_budget(lines, max_tokens)
+    removed["paragraphs over budget"] = dropped
+    return PreparedText(text, original_tokens, removed)
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+# Default location and size of the shared speech cache
+DEFAULT_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", "/tmp/doctalk/tts_cache")
+DEFAULT_MAX_BYTES = int(float(os.environ.get("TTS_CACHE_MAX_MB", "512")) * 1024 * 1024)
+
+class TTSCache:
+    """
+    Content-addressed on-disk cache for synthesized speech.
+
+    Entries are keyed by a hash of everything that changes the audio, written atomically so that
+    several sessions (or processes) can share one directory, and evicted least-recently-used first
+    once the directory grows past max_bytes. Recency is tracked with the file modification time.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._size = self._scan_size()
+
+    @staticmethod
+    def make_key(text, voice_id, engine, language_code, output_format, sample_rate=None):
+        """Build the cache key for a synthesis request"""
+        parts = [text, voice_id, engine, language_code, output_format, str(sample_rate or "")]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _scan_size(self):
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass  # Removed by another process while scanning
+        return total
+
+    def get(self, key):
+        """Return the cached audio bytes for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as cached_file:
+                data = cached_file.read()
+            os.utime(path)  # Mark as recently used
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Store data under key using an atomic rename, then evict if the cache is over its size bound"""
+        if self.max_bytes <= 0 or len(data) > self.max_bytes:
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file in the same directory so the rename is atomic
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # The cache is best effort, a failed write must not fail the synthesis
+            print(f"Unable to write TTS cache entry {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            self._size += len(data)
+            over_budget = self._size > self.max_bytes
+
+        if over_budget:
+            self.evict()
+
+    def evict(self):
+        """Remove least-recently-used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith(".tmp"):
+                        continue  # Write in progress
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            # Re-sync with the disk, other processes may share the directory
+            total = sum(size for _, size, _ in entries)
+            entries.sort()
+
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+
+            self._size = total
+
+    def stats(self):
+        """Return hit/miss counters and the current cache size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size_bytes": self._size,
+            }
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_tts_cache():
+    """Return the process-wide speech cache, shared across Streamlit sessions and reruns"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = TTSCache()
+        return _default_cache
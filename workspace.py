@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+# Every job gets its own directory under this root
+WORKSPACE_ROOT = os.environ.get("WORKSPACE_ROOT", "/tmp/doctalk/jobs")
+WORKSPACE_QUOTA_BYTES = int(float(os.environ.get("WORKSPACE_QUOTA_MB", "1024")) * 1024 * 1024)
+
+# Workspaces left behind by a crashed process are removed once they are this old
+STALE_WORKSPACE_SECONDS = int(os.environ.get("STALE_WORKSPACE_SECONDS", str(6 * 3600)))
+
+# Define WorkspaceQuotaError exception
+class WorkspaceQuotaError(Exception):
+    """Custom exception raised when a job uses more disk than its quota."""
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+class JobWorkspace:
+    """
+    An isolated working directory for one episode.
+
+    All intermediate and final files of a job (images, per-line audio, the merged podcast and the
+    video) live here, so concurrent sessions never share file names. The directory is removed when
+    the workspace is closed, and check_quota() bounds how much disk a single job may use.
+    """
+
+    def __init__(self, root=WORKSPACE_ROOT, quota_bytes=WORKSPACE_QUOTA_BYTES, job_id=None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.quota_bytes = quota_bytes
+        os.makedirs(root, exist_ok=True)
+        for job_root in [root] + _job_roots:
+            cleanup_stale_workspaces(job_root)
+        self.path = tempfile.mkdtemp(prefix=f"job_{self.job_id}_", dir=root)
+        self.attached = []  # Directories outside the workspace that belong to the job
+
+    def file(self, name):
+        """Return the absolute path of a file inside the workspace"""
+        return os.path.join(self.path, name)
+
+    def attach_dir(self, path):
+        """Create a directory outside the workspace (e.g. one served to the browser) that counts towards the quota and is deleted with the workspace"""
+        os.makedirs(path, exist_ok=True)
+        self.attached.append(path)
+        return path
+
+    def usage(self):
+        """Return the number of bytes currently stored in the workspace"""
+        total = 0
+        for directory in [self.path] + self.attached:
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    try:
+                        total += os.path.getsize(os.path.join(root, name))
+                    except OSError:
+                        pass  # Removed while scanning
+        return total
+
+    def check_quota(self):
+        """Raise WorkspaceQuotaError if the job has used more disk than its quota"""
+        used = self.usage()
+        if self.quota_bytes > 0 and used > self.quota_bytes:
+            raise WorkspaceQuotaError(f"Job {self.job_id} uses {used / 1024 / 1024:.1f} MB, over its {self.quota_bytes / 1024 / 1024:.0f} MB quota")
+        return used
+
+    def cleanup(self):
+        """Delete the workspace and everything in it"""
+        for directory in [self.path] + self.attached:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+        return False
+
+def workspace_file(workspace, name):
+    """Return the path for name inside workspace, or name itself (the CWD) when there is no workspace"""
+    return workspace.file(name) if workspace else name
+
+_job_roots = []  # Other directories holding job_* directories, e.g. the HLS streams served to the browser
+_last_stale_scan = {}  # Root -> time of its last scan
+_stale_scan_lock = threading.Lock()
+
+def register_job_root(root):
+    """Have every new workspace also remove the stale job directories under root"""
+    with _stale_scan_lock:
+        if root not in _job_roots:
+            _job_roots.append(root)
+
+def cleanup_stale_workspaces(root=WORKSPACE_ROOT, max_age=STALE_WORKSPACE_SECONDS):
+    """Remove job directories older than max_age, at most once a minute per root"""
+    if not os.path.isdir(root):
+        return
+    with _stale_scan_lock:
+        now = time.time()
+        if now - _last_stale_scan.get(root, 0) < 60:
+            return
+        _last_stale_scan[root] = now
+
+    for entry in os.scandir(root):
+        try:
+            if entry.is_dir() and entry.name.startswith("job_") and now - entry.stat().st_mtime > max_age:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            continue